@@ -3,6 +3,8 @@ from pydantic import BaseModel
 import os
 from typing import Literal, Dict, Any
 import re
+import zlib
+import datetime
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI
 from langgraph.prebuilt import create_react_agent
@@ -11,7 +13,12 @@ from langgraph.checkpoint.memory import InMemorySaver
 from fastapi import FastAPI, HTTPException
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
+from langchain_core.runnables import RunnableConfig
+from storage import record_spend, load_sleep_summary
+from profiles import profile_cache, GOAL_KCAL_ADJUSTMENT
+from mealplan import plan_week, default_macro_targets
+from exercises import parse_request, compose_plan
+from sleepdata import sleep_insights
 
 
 # check_llm = model.invoke("what is breakfast?")
@@ -19,12 +26,13 @@ import psycopg2
 
 
 
-def nutrition_planner(userquery: str) -> Dict[str, Any]:
+def nutrition_planner(userquery: str, config: RunnableConfig) -> Dict[str, Any]:
     """
     Simple rule-based nutrition planner.
     - Detects goal: lose, gain, maintain weight.
     - Detects diet type: veg, vegan, non-veg.
-    - Returns 1-day sample meal plan + tips.
+    - Personalizes calorie/macro targets from the user's saved profile.
+    - Returns a 1-day meal plan that meets the targets (7 days if asked) + tips.
     """
     q = userquery.lower()
     print(f"Nutrition planner received query: {q}")
@@ -32,13 +40,10 @@ def nutrition_planner(userquery: str) -> Dict[str, Any]:
     # 1) Goal detection
     if any(k in q for k in ["lose fat", "fat loss", "weight loss", "slim", "reduce weight"]):
         goal = "weight_loss"
-        kcal_adj = -400
     elif any(k in q for k in ["gain weight", "bulk", "build mass"]):
         goal = "weight_gain"
-        kcal_adj = +300
     else:
         goal = "maintenance"
-        kcal_adj = 0
 
     # 2) Diet type
     if "vegan" in q:
@@ -48,37 +53,41 @@ def nutrition_planner(userquery: str) -> Dict[str, Any]:
     else:
         diet_type = "flexible"
 
-    # 3) Very rough calorie target (fallback when no profile data)
-    base_kcal = 2200
-    target_kcal = base_kcal + kcal_adj
-
-    # 4) Build a simple day plan
-    if diet_type == "vegan":
-        breakfast = "Oats with soy milk, banana, chia seeds, and peanut butter"
-        lunch = "Buddha bowl with quinoa, lentils, mixed veggies, and tahini"
-        dinner = "Tofu stir-fry with brown rice and mixed vegetables"
-    elif diet_type == "vegetarian":
-        breakfast = "Oats with yogurt/curd, nuts, and seasonal fruit"
-        lunch = "Dal, roti, mixed veg sabzi, and salad"
-        dinner = "Paneer/soy curry with brown rice and salad"
-    else:  # flexible / non-veg
-        breakfast = "Oats or eggs with whole-grain toast and fruit"
-        lunch = "Grilled chicken/fish or dal, brown rice, salad, and veggies"
-        dinner = "Light curry with beans or lean meat plus veggies"
+    # 3) Calorie target: from the cached profile, else a very rough fallback
+    user_id = config.get("configurable", {}).get("user_id")
+    try:
+        cached = profile_cache.get(user_id) if user_id else None
+    except Exception as e:
+        print(f"Profile lookup failed, using fallback target: {e}")
+        cached = None
+
+    if cached:
+        targets = cached["derived"]["targets"][goal]
+        target_kcal = targets["calories"]
+    else:
+        base_kcal = 2200
+        target_kcal = base_kcal + GOAL_KCAL_ADJUSTMENT[goal]
+        targets = default_macro_targets(target_kcal)
+
+    # 4) Pick catalog meals that hit the calorie/macro target; a new week each ISO week per user
+    year, week_no, _ = datetime.date.today().isocalendar()
+    week = plan_week(targets, diet_type, seed=zlib.crc32(f"{user_id}:{year}-{week_no}".encode("utf-8")))
+    # The week runs Monday..Sunday, so today's meals match the week_plan entry for today
+    today = week["days"][datetime.date.today().weekday()]
 
     response = {
         "goal": goal,
         "diet_type": diet_type,
         "target_calories_approx": target_kcal,
+        "personalized": cached is not None,
+        "macro_targets_g": {k: v for k, v in targets.items() if k != "calories"},
         "day_plan": {
-            "breakfast": breakfast,
-            "lunch": lunch,
-            "dinner": dinner,
-            "snacks": [
-                "Handful of nuts or seeds",
-                "One fruit (apple, banana, or seasonal fruit)",
-                "Optional: yogurt/curd or buttermilk"
-            ]
+            "breakfast": today["breakfast"],
+            "lunch": today["lunch"],
+            "dinner": today["dinner"],
+            "snacks": today["snacks"],
+            "main_meal_portion": today["main_meal_portion"],
+            "totals": today["totals"]
         },
         "tips": [
             "Aim for at least 20-30 g protein per main meal.",
@@ -87,69 +96,30 @@ def nutrition_planner(userquery: str) -> Dict[str, Any]:
             "Drink enough water throughout the day."
         ]
     }
+    if any(k in q for k in ["week", "7 day", "7-day", "seven day"]):
+        response["week_plan"] = week["days"]
+        response["plan_quality"] = week["quality"]
+    if cached:
+        response["bmr"] = cached["derived"]["bmr"]
+        response["tdee"] = cached["derived"]["tdee"]
     return response
 
 def fitness_trackker(userquery: str) -> Dict[str, Any]:
     """
-    Simple workout recommender:
-    - Detects experience: beginner / intermediate.
-    - Detects goal: strength, fat loss, general fitness.
-    - Returns 3-day template with sets/reps.
+    Workout recommender backed by the indexed exercise catalog:
+    - Detects experience (beginner / intermediate / advanced), goal, available
+      equipment, days per week, session length and any focus muscles.
+    - Composes a split for that many days from data/exercises.csv, with sets/reps by goal.
     """
-    q = userquery.lower()
-
-    # Experience
-    if any(k in q for k in ["beginner", "new to gym", "starting out"]):
-        level = "beginner"
-    elif any(k in q for k in ["intermediate", "lifting for years", "advanced"]):
-        level = "intermediate"
-    else:
-        level = "beginner"
-
-    # Goal
-    if any(k in q for k in ["lose fat", "fat loss", "cutting"]):
-        goal = "fat_loss"
-    elif any(k in q for k in ["gain muscle", "build muscle", "hypertrophy", "bulk"]):
-        goal = "muscle_gain"
-    else:
-        goal = "general_fitness"
-
-    # Simple 3-day split
-    day1 = {
-        "name": "Full body A",
-        "exercises": [
-            {"name": "Squat (bodyweight or barbell)", "sets": 3, "reps": 8 if goal == "muscle_gain" else 12},
-            {"name": "Push-up or Bench Press", "sets": 3, "reps": 8 if goal == "muscle_gain" else 12},
-            {"name": "Row (cable/dumbbell)", "sets": 3, "reps": 10},
-            {"name": "Plank", "sets": 3, "duration_seconds": 30}
-        ]
-    }
-
-    day2 = {
-        "name": "Cardio & Core",
-        "exercises": [
-            {"name": "Brisk walk or light jog", "duration_minutes": 20},
-            {"name": "Cycling / cross-trainer", "duration_minutes": 15},
-            {"name": "Crunches", "sets": 3, "reps": 15},
-            {"name": "Side plank", "sets": 3, "duration_seconds": 20}
-        ]
-    }
-
-    day3 = {
-        "name": "Full body B",
-        "exercises": [
-            {"name": "Deadlift or hip hinge variation", "sets": 3, "reps": 6 if goal == "muscle_gain" else 10},
-            {"name": "Overhead press (dumbbell/barbell)", "sets": 3, "reps": 8},
-            {"name": "Lat pulldown / pull-up", "sets": 3, "reps": 8},
-            {"name": "Lunges", "sets": 3, "reps_per_leg": 10}
-        ]
-    }
+    request = parse_request(userquery)
 
     response = {
-        "level": level,
-        "goal": goal,
-        "recommended_frequency_per_week": 3 if level == "beginner" else 4,
-        "plan": [day1, day2, day3],
+        "level": request["level"],
+        "goal": request["goal"],
+        "recommended_frequency_per_week": request["days"],
+        "session_minutes": request["session_minutes"],
+        "equipment": sorted(request["equipment"]),
+        "plan": compose_plan(request),
         "general_tips": [
             "Warm up for 5–10 minutes before workouts.",
             "Use a weight where the last 2 reps are challenging but doable with good form.",
@@ -160,11 +130,13 @@ def fitness_trackker(userquery: str) -> Dict[str, Any]:
     return response
 
 
-def sleep_optimizer(userquery: str) -> Dict[str, Any]:
+def sleep_optimizer(userquery: str, config: RunnableConfig) -> Dict[str, Any]:
     """
-    Rule-based sleep advice:
+    Sleep advice:
     - Tries to detect age group.
     - Recommends target sleep range + simple schedule.
+    - When the user has uploaded wearable data, adds their precomputed sleep stats
+      and tips based on them.
     """
     q = userquery.lower()
     print(f"Sleep optimizer received query: {q}")
@@ -218,6 +190,26 @@ def sleep_optimizer(userquery: str) -> Dict[str, Any]:
             "Use bed mostly for sleep, not for work or long phone scrolling."
         ]
     }
+
+    # Precomputed per-user stats from uploaded sleep exports, if any
+    user_id = config.get("configurable", {}).get("user_id")
+    try:
+        summary = load_sleep_summary(user_id) if user_id else None
+    except Exception as e:
+        print(f"Sleep summary lookup failed, answering without it: {e}")
+        summary = None
+
+    if summary:
+        response["your_sleep"] = summary
+        # Anchor the schedule on the user's usual wake-up time
+        min_hours, max_hours = (int(h) for h in re.findall(r"\d+", recommended_hours)[:2])
+        wake_h, wake_m = (int(x) for x in summary["avg_wake_time"].split(":"))
+        earliest, latest = ((wake_h - h) % 24 for h in (max_hours, min_hours))
+        response["suggested_schedule"] = {
+            "target_bed_time": f"{earliest:02d}:{wake_m:02d}-{latest:02d}:{wake_m:02d}",
+            "target_wake_time": summary["avg_wake_time"]
+        }
+        response["sleep_hygiene_tips"] = sleep_insights(summary, min_hours) + response["sleep_hygiene_tips"]
     return response
 
 
@@ -262,7 +254,7 @@ def mental_wellness(userquery: str) -> Dict[str, Any]:
     }
     return response
 
-def log_health_spend( amount: float, category: Literal['nutrition', 'fitness', 'wellness'], description: str) -> str:
+def log_health_spend( amount: float, category: Literal['nutrition', 'fitness', 'wellness'], description: str, config: RunnableConfig) -> str:
     """
     Records a health-related expense into the database. 
     Use this tool whenever a user mentions spending money on health, gym, food, or supplements.
@@ -272,36 +264,19 @@ def log_health_spend( amount: float, category: Literal['nutrition', 'fitness', '
         category: The type of spend. Must be 'nutrition', 'fitness', or 'wellness'.
         description: A short summary of what the money was spent on.
     """
-    DB_HOST = os.getenv("DB_HOST")
-    DB_NAME = os.getenv("DB_NAME")
-    DB_USER = os.getenv("DB_USER") 
-    DB_PASS = os.getenv("DB_PASS")
+    # Injected by LangGraph from the /chat request, never chosen by the model
+    user_id = config.get("configurable", {}).get("user_id")
+    if not user_id:
+        return "Error logging spend: no user is attached to this request."
 
-    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-    
     try:
-        with conn.cursor() as curs:
-            # Log the entry
-            curs.execute(
-                "INSERT INTO health_spending_log (user_id, category, amount, description) "
-                "VALUES (%s, %s, %s, %s)",
-                ('1', category, amount, description)
-            )
-            
-            # Fetch updated totals for the response
-            curs.execute("""
-                SELECT category, COALESCE(SUM(amount), 0) 
-                FROM health_spending_log WHERE user_id = '1' GROUP BY category
-            """)
-            totals = dict(curs.fetchall())
-            conn.commit()
-            
-            # Return a clear confirmation string so the LLM knows it's done
-            return f"Successfully logged ₹{amount} for {description}. Current totals: {totals}"
+        # Routed to the user's shard; totals are computed on that shard only
+        totals = record_spend(user_id, category, amount, description)
+
+        # Return a clear confirmation string so the LLM knows it's done
+        return f"Successfully logged ₹{amount} for {description}. Current totals: {totals}"
     except Exception as e:
         return f"Error logging spend: {str(e)}"
-    finally:
-        conn.close()
 
 # 3. Create Agent with strict instructions to prevent loops
 system_prompt = (
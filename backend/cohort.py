@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from profiles import (
+    ACTIVITY_FACTORS,
+    GOAL_KCAL_ADJUSTMENT,
+    GOAL_PROTEIN_G_PER_KG,
+    FAT_SHARE_OF_KCAL,
+    MIN_TARGET_KCAL,
+    derive_targets,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow/Parquet is optional; .npz is used without it
+    pa = None
+    pq = None
+
+
+# Category orders define the integer codes used in the columnar output
+SEXES = ["male", "female", "other"]
+ACTIVITY_LEVELS = list(ACTIVITY_FACTORS)
+GOALS = list(GOAL_KCAL_ADJUSTMENT)
+DIET_TYPES = ["flexible", "vegetarian", "vegan"]
+# Same levels as the per-user workout composer (exercises.LEVELS)
+FITNESS_LEVELS = ["beginner", "intermediate", "advanced"]
+FITNESS_GOALS = ["fat_loss", "general_fitness", "muscle_gain"]
+
+SEX_BMR_OFFSET = np.array([5.0, -161.0, -78.0])
+ACTIVITY_FACTOR = np.array([ACTIVITY_FACTORS[a] for a in ACTIVITY_LEVELS])
+GOAL_KCAL = np.array([GOAL_KCAL_ADJUSTMENT[g] for g in GOALS], dtype=float)
+GOAL_PROTEIN = np.array([GOAL_PROTEIN_G_PER_KG[g] for g in GOALS])
+# Nutrition goal -> fitness goal, and activity level -> fitness level
+NUTRITION_TO_FITNESS_GOAL = {"weight_loss": "fat_loss", "maintenance": "general_fitness", "weight_gain": "muscle_gain"}
+ACTIVITY_TO_FITNESS_LEVEL = {
+    "sedentary": "beginner", "light": "beginner",
+    "moderate": "intermediate", "active": "intermediate",
+    "very_active": "advanced",
+}
+GOAL_TO_FITNESS_GOAL = np.array([FITNESS_GOALS.index(NUTRITION_TO_FITNESS_GOAL[g]) for g in GOALS])
+ACTIVITY_TO_LEVEL = np.array([FITNESS_LEVELS.index(ACTIVITY_TO_FITNESS_LEVEL[a]) for a in ACTIVITY_LEVELS])
+
+NUTRITION_TEMPLATES = [f"{d}/{g}" for d in DIET_TYPES for g in GOALS]
+FITNESS_TEMPLATES = [f"{l}/{g}" for l in FITNESS_LEVELS for g in FITNESS_GOALS]
+
+
+def encode(values, categories: List[str], default: int = 0) -> np.ndarray:
+    """
+    Maps a string column to integer codes in `categories` order (unknown -> default).
+    Integer columns are taken as codes and must lie in 0..len(categories)-1.
+    Only the unique values are looked up in Python, so this stays vectorized for
+    large cohorts.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu":
+        bad = (arr < 0) | (arr >= len(categories))
+        if bad.any():
+            raise ValueError(
+                f"{int(bad.sum())} code(s) outside 0..{len(categories) - 1} "
+                f"(e.g. {arr[bad][0]}) for categories {categories}"
+            )
+        return arr.astype(np.int8)
+    uniques, inverse = np.unique(arr.astype(str), return_inverse=True)
+    index = {c: i for i, c in enumerate(categories)}
+    mapped = np.array([index.get(u.lower(), default) for u in uniques], dtype=np.int8)
+    return mapped[inverse]
+
+
+def classify_goals(weight_kg: np.ndarray, height_cm: np.ndarray) -> np.ndarray:
+    """Goal codes from BMI: >= 25 weight_loss, < 18.5 weight_gain, otherwise maintenance."""
+    bmi = weight_kg / (height_cm / 100) ** 2
+    goals = np.full(len(bmi), GOALS.index("maintenance"), dtype=np.int8)
+    goals[bmi >= 25] = GOALS.index("weight_loss")
+    goals[bmi < 18.5] = GOALS.index("weight_gain")
+    return goals
+
+
+def plan_cohort(columns: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Computes nightly targets for a whole cohort in one vectorized pass.
+
+    Input columns: age, sex, weight_kg, height_cm, activity_level, and optionally
+    user_id, goal (otherwise classified from BMI) and diet_type (default flexible).
+    Categorical outputs are integer codes into GOALS, NUTRITION_TEMPLATES, etc.
+    Results match profiles.derive_targets() row for row.
+    Rows with a missing, non-finite or non-positive age, weight_kg or height_cm get
+    valid=False and zeroed outputs (written as nulls to Parquet) instead of garbage.
+    """
+    age = np.asarray(columns["age"], dtype=float)
+    weight = np.asarray(columns["weight_kg"], dtype=float)
+    height = np.asarray(columns["height_cm"], dtype=float)
+    n = len(age)
+    valid = np.ones(n, dtype=bool)
+    for values in (age, weight, height):
+        valid &= np.isfinite(values) & (values > 0)
+    # Placeholders keep the arithmetic (and the int casts) clean; outputs are zeroed below
+    age, weight, height = (np.where(valid, v, 1.0) for v in (age, weight, height))
+
+    sex = encode(columns["sex"], SEXES, default=SEXES.index("other"))
+    activity = encode(columns["activity_level"], ACTIVITY_LEVELS, default=ACTIVITY_LEVELS.index("light"))
+    if "goal" in columns:
+        goal = encode(columns["goal"], GOALS, default=GOALS.index("maintenance"))
+    else:
+        goal = classify_goals(weight, height)
+    diet = encode(columns["diet_type"], DIET_TYPES) if "diet_type" in columns else np.zeros(n, dtype=np.int8)
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + SEX_BMR_OFFSET[sex]
+    tdee = bmr * ACTIVITY_FACTOR[activity]
+    kcal = np.maximum(MIN_TARGET_KCAL, np.round(tdee + GOAL_KCAL[goal]))
+    protein = np.round(GOAL_PROTEIN[goal] * weight)
+    fat = np.round(kcal * FAT_SHARE_OF_KCAL / 9)
+    carbs = np.maximum(0, np.round((kcal - protein * 4 - fat * 9) / 4))
+
+    fitness_level = ACTIVITY_TO_LEVEL[activity]
+    fitness_goal = GOAL_TO_FITNESS_GOAL[goal]
+
+    result = {
+        "goal": goal,
+        "bmr": np.round(bmr).astype(np.int32),
+        "tdee": np.round(tdee).astype(np.int32),
+        "target_calories": kcal.astype(np.int32),
+        "protein_g": protein.astype(np.int32),
+        "carbs_g": carbs.astype(np.int32),
+        "fat_g": fat.astype(np.int32),
+        "nutrition_template": (diet * len(GOALS) + goal).astype(np.int8),
+        "fitness_template": (fitness_level * len(FITNESS_GOALS) + fitness_goal).astype(np.int8),
+    }
+    for values in result.values():
+        values[~valid] = 0
+    result["valid"] = valid
+    if "user_id" in columns:
+        result = {"user_id": np.asarray(columns["user_id"]), **result}
+    return result
+
+
+CATEGORY_COLUMNS = {
+    "goal": GOALS,
+    "nutrition_template": NUTRITION_TEMPLATES,
+    "fitness_template": FITNESS_TEMPLATES,
+}
+
+
+def read_columns(path: str) -> Dict[str, Any]:
+    """Reads a cohort from Parquet (needs pyarrow) or .npz into a dict of NumPy arrays."""
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    if pq is None:
+        raise RuntimeError("pyarrow is required to read Parquet cohorts; use .npz instead.")
+    table = pq.read_table(path)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def write_columns(result: Dict[str, np.ndarray], path: str):
+    """
+    Writes the plan columns. Parquet stores categories as dictionary columns and
+    invalid rows as nulls; .npz stores the integer codes, the `valid` column and a
+    `<name>__categories` array per category column.
+    """
+    if path.endswith(".npz"):
+        extras = {f"{k}__categories": np.array(v) for k, v in CATEGORY_COLUMNS.items()}
+        np.savez(path, **result, **extras)
+        return
+    if pa is None:
+        raise RuntimeError("pyarrow is required to write Parquet output; use .npz instead.")
+    invalid = ~result["valid"]
+    arrays = {}
+    for name, values in result.items():
+        if name == "valid":
+            continue
+        mask = None if name == "user_id" else invalid
+        if name in CATEGORY_COLUMNS:
+            arrays[name] = pa.DictionaryArray.from_arrays(pa.array(values, mask=mask), CATEGORY_COLUMNS[name])
+        else:
+            arrays[name] = pa.array(values, mask=mask)
+    pq.write_table(pa.table(arrays), path)
+
+
+def run_cohort(input_path: str, output_path: str) -> int:
+    """Nightly batch entry point: read profiles, plan, write results. Returns the row count."""
+    columns = read_columns(input_path)
+    result = plan_cohort(columns)
+    invalid = int((~result["valid"]).sum())
+    if invalid:
+        print(f"{invalid:,} profile(s) with missing or invalid age/weight_kg/height_cm, written as nulls")
+    write_columns(result, output_path)
+    return len(result["goal"])
+
+
+def _synthetic_cohort(n: int, seed: int = 7) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return {
+        "user_id": np.arange(n),
+        "age": rng.integers(18, 80, n),
+        "sex": rng.choice(SEXES, n),
+        "weight_kg": rng.uniform(45, 130, n).round(1),
+        "height_cm": rng.uniform(150, 200, n).round(1),
+        "activity_level": rng.choice(ACTIVITY_LEVELS, n),
+        "diet_type": rng.choice(DIET_TYPES, n),
+    }
+
+
+def _per_user(columns: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+    """The per-user path the batch replaces: one profile dict, derive_targets, Python branching."""
+    profile = {k: columns[k][i].item() for k in ["age", "sex", "weight_kg", "height_cm", "activity_level"]}
+    bmi = profile["weight_kg"] / (profile["height_cm"] / 100) ** 2
+    goal = "weight_loss" if bmi >= 25 else "weight_gain" if bmi < 18.5 else "maintenance"
+    derived = derive_targets(profile)
+    return {"goal": goal, **derived["targets"][goal]}
+
+
+if __name__ == "__main__":
+    # python cohort.py <input.parquet|.npz> <output.parquet|.npz>
+    # python cohort.py --bench [rows]
+    if len(sys.argv) >= 2 and sys.argv[1] == "--bench":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+        columns = _synthetic_cohort(n)
+
+        start = time.perf_counter()
+        result = plan_cohort(columns)
+        batch_s = time.perf_counter() - start
+
+        sample = min(n, 50000)
+        start = time.perf_counter()
+        expected = [_per_user(columns, i) for i in range(sample)]
+        per_user_s = time.perf_counter() - start
+
+        for i, row in enumerate(expected):
+            assert GOALS[result["goal"][i]] == row["goal"]
+            assert result["target_calories"][i] == row["calories"]
+            assert result["protein_g"][i] == row["protein_g"]
+
+        print(f"vectorized: {n / batch_s:,.0f} rows/s ({n:,} rows in {batch_s:.3f}s)")
+        print(f"per-user:   {sample / per_user_s:,.0f} rows/s ({sample:,} rows in {per_user_s:.3f}s)")
+
+        out = os.path.join(os.getenv("TMPDIR", "/tmp"), "cohort_bench.parquet" if pa else "cohort_bench.npz")
+        start = time.perf_counter()
+        write_columns(result, out)
+        print(f"write {out}: {time.perf_counter() - start:.3f}s")
+    else:
+        rows = run_cohort(sys.argv[1], sys.argv[2])
+        print(f"Planned {rows:,} profiles -> {sys.argv[2]}")
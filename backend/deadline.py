@@ -0,0 +1,105 @@
+import os
+import time
+import contextvars
+from typing import Optional, Dict, Any, List
+
+
+# Server default, overridable per request with the X-Request-Deadline-Ms header
+DEFAULT_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "20000"))
+MAX_DEADLINE_MS = int(os.getenv("MAX_REQUEST_DEADLINE_MS", "60000"))
+# Time kept back from the agent so a degraded answer can still be built and sent
+DEGRADE_RESERVE_MS = int(os.getenv("DEGRADE_RESERVE_MS", "300"))
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage starts after the request's deadline has passed."""
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) by which a request must answer."""
+
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        # Side effects started by tools ({"what", "status"}); a cancelled agent leaves
+        # its worker threads running, so a degraded answer must still report these
+        self.writes: List[Dict[str, Any]] = []
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_for_work(self) -> float:
+        """Seconds left once the degradation reserve is kept back."""
+        return max(0.0, self.remaining() - DEGRADE_RESERVE_MS / 1000)
+
+    def check(self, stage: str):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"deadline of {self.budget_ms} ms exceeded before {stage}")
+
+    def check_work(self, stage: str):
+        """Like check(), but the degradation reserve is already off limits."""
+        if self.remaining_for_work() <= 0:
+            raise DeadlineExceeded(f"no time left in the {self.budget_ms} ms deadline for {stage}")
+
+
+# Carried through asyncio tasks and LangChain's executor threads via contextvars
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def budget_from_header(value: Optional[str]) -> int:
+    """Parses the client header, falling back to the server default and clamping to the max."""
+    try:
+        budget = int(value) if value else DEFAULT_DEADLINE_MS
+    except ValueError:
+        budget = DEFAULT_DEADLINE_MS
+    return max(1, min(budget, MAX_DEADLINE_MS))
+
+
+def start(budget_ms: int) -> Deadline:
+    deadline = Deadline(budget_ms)
+    _current.set(deadline)
+    return deadline
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left on the current request, or `default` outside a request."""
+    deadline = _current.get()
+    return deadline.remaining() if deadline else default
+
+
+def check(stage: str):
+    deadline = _current.get()
+    if deadline:
+        deadline.check(stage)
+
+
+def remaining_for_work(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the degradation reserve, or `default` outside a request."""
+    deadline = _current.get()
+    return deadline.remaining_for_work() if deadline else default
+
+
+def check_work(stage: str):
+    """Use before writes: one that starts now must not land after a degraded reply."""
+    deadline = _current.get()
+    if deadline:
+        deadline.check_work(stage)
+
+
+def begin_write(what: str) -> Dict[str, Any]:
+    """Registers a write on the current request; finish it with end_write()."""
+    write = {"what": what, "status": "pending"}
+    deadline = _current.get()
+    if deadline:
+        deadline.writes.append(write)
+    return write
+
+
+def end_write(write: Dict[str, Any], ok: bool):
+    write["status"] = "recorded" if ok else "failed"
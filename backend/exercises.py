@@ -0,0 +1,272 @@
+import os
+import re
+import csv
+import sys
+import time
+import functools
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+from fooddb import DATA_DIR
+
+
+EXERCISE_CSV = os.getenv("EXERCISE_CSV", os.path.join(DATA_DIR, "exercises.csv"))
+
+INDEXED_FIELDS = ["muscle_group", "equipment", "difficulty", "pattern"]
+LEVELS = ["beginner", "intermediate", "advanced"]
+ALL_EQUIPMENT = {"bodyweight", "dumbbell", "barbell", "kettlebell", "machine", "cable", "band", "cardio_machine"}
+HOME_EQUIPMENT = {"bodyweight", "dumbbell", "band", "kettlebell"}
+WARMUP_MINUTES = 5
+
+# Day types: slots in priority order, as "pattern" or "pattern:muscle_group"; a day takes
+# as many as the session allows
+DAY_TYPES = {
+    "Full body A": ["squat", "horizontal_push", "horizontal_pull", "hinge", "core", "vertical_push", "lunge", "isolation"],
+    "Full body B": ["hinge", "vertical_push", "vertical_pull", "lunge", "core", "horizontal_push", "squat", "isolation"],
+    "Cardio & Core": ["cardio", "cardio", "core", "core", "carry"],
+    "Upper A": ["horizontal_push", "horizontal_pull", "vertical_push", "vertical_pull", "isolation:shoulders", "isolation:arms", "core"],
+    "Upper B": ["vertical_push", "vertical_pull", "horizontal_push", "horizontal_pull", "isolation:arms", "isolation:shoulders", "core"],
+    "Lower A": ["squat", "hinge", "lunge", "isolation:quads", "core", "isolation:calves"],
+    "Lower B": ["hinge", "squat", "lunge", "core", "isolation:calves", "isolation:quads"],
+    "Push": ["horizontal_push", "vertical_push", "horizontal_push", "isolation:shoulders", "isolation:arms", "core"],
+    "Pull": ["vertical_pull", "horizontal_pull", "horizontal_pull", "isolation:shoulders", "isolation:arms", "carry"],
+    "Legs": ["squat", "hinge", "lunge", "isolation:quads", "isolation:calves", "core"],
+}
+SPLITS = {
+    1: ["Full body A"],
+    2: ["Full body A", "Full body B"],
+    3: ["Full body A", "Cardio & Core", "Full body B"],
+    4: ["Upper A", "Lower A", "Upper B", "Lower B"],
+    5: ["Push", "Pull", "Legs", "Upper A", "Lower B"],
+    6: ["Push", "Pull", "Legs", "Push", "Pull", "Legs"],
+}
+# (sets, reps, hold seconds, cardio minutes) per goal
+GOAL_SCHEMES = {
+    "strength": (5, 5, 30, 15),
+    "muscle_gain": (4, 8, 30, 15),
+    "fat_loss": (3, 12, 40, 25),
+    "general_fitness": (3, 10, 30, 20),
+}
+
+# Whole words only (plurals listed), so "husband" doesn't mean resistance bands
+EQUIPMENT_KEYWORDS = {
+    "dumbbell": "dumbbell", "dumbbells": "dumbbell", "barbell": "barbell", "barbells": "barbell",
+    "kettlebell": "kettlebell", "kettlebells": "kettlebell", "machine": "machine", "machines": "machine",
+    "cable": "cable", "cables": "cable", "band": "band", "bands": "band",
+    "treadmill": "cardio_machine", "bike": "cardio_machine", "rower": "cardio_machine",
+}
+MUSCLE_KEYWORDS = {
+    "chest": "chest", "shoulder": "shoulders", "shoulders": "shoulders", "arm": "arms", "arms": "arms",
+    "biceps": "arms", "triceps": "arms", "glute": "glutes", "glutes": "glutes",
+    "hamstring": "hamstrings", "hamstrings": "hamstrings", "quad": "quads", "quads": "quads",
+    "calf": "calves", "calves": "calves", "abs": "core", "core": "core",
+}
+# "push pull legs" and "get back in shape" aren't focus requests: these count only
+# inside a focus phrase ("focus on back and legs")
+FOCUS_ONLY_KEYWORDS = {"back": "back", "leg": "quads", "legs": "quads"}
+FOCUS_PHRASE = re.compile(r"\b(?:focus(?:ing)?|emphasi[sz]e|emphasis|prioriti[sz]e|target(?:ing)?)\b(?:\s+on)?([^,.;!?]*)")
+
+
+def _keyword_values(keywords: Dict[str, str], text: str) -> set:
+    return {v for k, v in keywords.items() if re.search(rf"\b{k}\b", text)}
+
+
+class ExerciseCatalog:
+    """
+    Exercise rows plus an inverted index (field, value) -> bitset of row ids.
+    Bitsets are Python ints, so filters are single &/| operations.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.index: Dict[tuple, int] = defaultdict(int)
+        for i, row in enumerate(rows):
+            bit = 1 << i
+            for field in INDEXED_FIELDS:
+                self.index[(field, row[field])] |= bit
+        self.all = (1 << len(rows)) - 1
+
+    def any_of(self, field: str, values) -> int:
+        bits = 0
+        for v in values:
+            bits |= self.index.get((field, v), 0)
+        return bits
+
+    def lookup(self, **filters) -> List[Dict[str, Any]]:
+        """lookup(pattern="squat", equipment={"dumbbell"}) -> matching rows, in catalog order."""
+        bits = self.all
+        for field, value in filters.items():
+            bits &= self.any_of(field, value if isinstance(value, (set, list, tuple)) else [value])
+        return [self.rows[i] for i in iter_bits(bits)]
+
+
+def iter_bits(bits: int):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def first_bit(bits: int) -> int:
+    return (bits & -bits).bit_length() - 1
+
+
+def read_catalog(path: str) -> List[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [{**r, "minutes": float(r["minutes"])} for r in csv.DictReader(f)]
+
+
+@functools.lru_cache(maxsize=1)
+def get_catalog() -> ExerciseCatalog:
+    """Loaded and indexed on first use, not at import."""
+    return ExerciseCatalog(read_catalog(EXERCISE_CSV))
+
+
+def parse_request(userquery: str) -> Dict[str, Any]:
+    """Level, goal, equipment, days per week, session length and focus muscles from free text."""
+    q = userquery.lower()
+
+    if any(k in q for k in ["advanced", "lifting for years", "experienced"]):
+        level = "advanced"
+    elif "intermediate" in q:
+        level = "intermediate"
+    else:
+        level = "beginner"
+
+    if any(k in q for k in ["lose fat", "fat loss", "cutting", "weight loss"]):
+        goal = "fat_loss"
+    elif any(k in q for k in ["gain muscle", "build muscle", "hypertrophy", "bulk"]):
+        goal = "muscle_gain"
+    elif any(k in q for k in ["strength", "stronger", "powerlifting"]):
+        goal = "strength"
+    else:
+        goal = "general_fitness"
+
+    if any(k in q for k in ["no equipment", "bodyweight", "body weight", "no gym"]):
+        equipment = {"bodyweight"}
+    else:
+        equipment = _keyword_values(EQUIPMENT_KEYWORDS, q)
+        if equipment:
+            equipment.add("bodyweight")
+        elif "home" in q:
+            equipment = set(HOME_EQUIPMENT)
+        else:
+            equipment = set(ALL_EQUIPMENT)
+
+    m = re.search(r"\b([1-6])\s*(?:-\s*)?(?:days?|x|times)\b", q)
+    days = int(m.group(1)) if m else (3 if level == "beginner" else 4)
+
+    m = re.search(r"\b(\d{2,3})\s*(?:min|mins|minutes)\b", q)
+    if m:
+        minutes = int(m.group(1))
+    elif re.search(r"\b(an|1|one)\s*(hour|hr)\b", q):
+        minutes = 60
+    else:
+        minutes = 45
+
+    focus = _keyword_values(MUSCLE_KEYWORDS, q)
+    for phrase in FOCUS_PHRASE.findall(q):
+        focus |= _keyword_values(FOCUS_ONLY_KEYWORDS, phrase)
+    focus = sorted(focus)
+    return {"level": level, "goal": goal, "equipment": equipment, "days": days, "session_minutes": minutes, "focus": focus}
+
+
+def _prescription(row: Dict[str, Any], goal: str) -> Dict[str, Any]:
+    sets, reps, hold, cardio = GOAL_SCHEMES[goal]
+    if row["unit"] == "minutes":
+        return {"name": row["name"], "duration_minutes": cardio}
+    if row["unit"] == "seconds":
+        return {"name": row["name"], "sets": 3, "duration_seconds": hold}
+    if row["pattern"] in ("isolation", "core"):
+        return {"name": row["name"], "sets": 3, "reps": max(reps, 12)}
+    return {"name": row["name"], "sets": sets, "reps": reps}
+
+
+def compose_plan(request: Dict[str, Any], catalog: Optional[ExerciseCatalog] = None) -> List[Dict[str, Any]]:
+    """
+    Builds an N-day split:
+    - Each day fills its pattern slots from the index (pattern & equipment & difficulty),
+      preferring the user's level, then easier variants, and exercises not used yet this week.
+    - Slots stop once the session length (plus warm-up) is used up.
+    - Focus muscles get one extra slot on days that already train them, when time allows.
+    """
+    catalog = catalog or get_catalog()
+    allowed_levels = LEVELS[:LEVELS.index(request["level"]) + 1]
+    usable = catalog.any_of("equipment", request["equipment"]) & catalog.any_of("difficulty", allowed_levels)
+    by_level = [catalog.index.get(("difficulty", lvl), 0) for lvl in reversed(allowed_levels)]
+    focus_bits = catalog.any_of("muscle_group", request["focus"])
+    budget = request["session_minutes"] - WARMUP_MINUTES
+
+    def slot_bits(slot: str) -> int:
+        if slot == "focus":
+            return focus_bits
+        pattern, _, muscle = slot.partition(":")
+        bits = catalog.index.get(("pattern", pattern), 0)
+        return bits & catalog.index.get(("muscle_group", muscle), 0) if muscle else bits
+
+    used = 0
+    plan = []
+    for day_name in SPLITS[min(max(request["days"], 1), 6)]:
+        slots = list(DAY_TYPES[day_name])
+        day_bits = 0
+        for slot in slots:
+            day_bits |= slot_bits(slot)
+        if usable & day_bits & focus_bits:
+            slots.insert(2, "focus")
+        exercises, minutes, taken_today = [], 0.0, 0
+        for slot in slots:
+            pool = usable & slot_bits(slot) & ~taken_today
+            if not pool:
+                continue
+            # Prefer: not used this week at the user's level, then any level, then repeats
+            choice = None
+            for bits in [pool & ~used & lvl for lvl in by_level] + [pool & ~used, pool]:
+                if bits:
+                    choice = first_bit(bits)
+                    break
+            row = catalog.rows[choice]
+            if minutes + row["minutes"] > budget:
+                continue
+            minutes += row["minutes"]
+            taken_today |= 1 << choice
+            used |= 1 << choice
+            exercises.append(_prescription(row, request["goal"]))
+        plan.append({"name": day_name, "exercises": exercises, "estimated_minutes": round(minutes + WARMUP_MINUTES)})
+    return plan
+
+
+if __name__ == "__main__":
+    # Composition latency over a large synthetic catalog: python exercises.py [n_exercises]
+    import random
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(7)
+    seed_rows = read_catalog(EXERCISE_CSV)
+    variants = ["tempo", "paused", "single-arm", "single-leg", "deficit", "banded", "isometric", "wide-grip"]
+    rows = list(seed_rows)
+    while len(rows) < n:
+        base = rng.choice(seed_rows)
+        rows.append({**base, "name": f"{rng.choice(variants)} {base['name']} #{len(rows)}",
+                     "difficulty": rng.choice(LEVELS), "equipment": rng.choice(sorted(ALL_EQUIPMENT))})
+
+    start = time.perf_counter()
+    catalog = ExerciseCatalog(rows)
+    print(f"index {len(rows):,} exercises: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    queries = [
+        "beginner 3 day full body at home, 30 minutes",
+        "intermediate 4 day split to build muscle with dumbbells and barbell, 60 minutes",
+        "advanced 6 day push pull legs for strength, 75 min",
+        "5 days a week fat loss, bodyweight only, 40 minutes, focus on glutes",
+    ]
+    requests = [parse_request(q) for q in queries]
+    runs = 500
+    start = time.perf_counter()
+    for i in range(runs):
+        compose_plan(requests[i % len(requests)], catalog)
+    print(f"compose_plan: {(time.perf_counter() - start) / runs * 1000:.3f} ms/plan")
+
+    start = time.perf_counter()
+    for i in range(runs):
+        catalog.lookup(pattern="squat", equipment={"dumbbell", "bodyweight"}, difficulty="beginner")
+    print(f"index lookup: {(time.perf_counter() - start) / runs * 1e6:.1f} us/query")
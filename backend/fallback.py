@@ -0,0 +1,89 @@
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+
+FALLBACK_TEXT = (
+    "Sorry, I couldn't finish a full answer in time. "
+    "Try asking about one topic at a time (nutrition, fitness, sleep, wellness or spending)."
+)
+
+TEMPLATE_HEADER = "Here is what I found (quick summary, the full answer took too long):"
+
+
+def _title(key: str) -> str:
+    return str(key).replace("_", " ").capitalize()
+
+
+def _render_value(value: Any, depth: int) -> List[str]:
+    pad = "  " * depth
+    lines = []
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if isinstance(v, (dict, list)):
+                lines.append(f"{pad}- {_title(k)}:")
+                lines.extend(_render_value(v, depth + 1))
+            else:
+                lines.append(f"{pad}- {_title(k)}: {v}")
+    elif isinstance(value, list):
+        for item in value:
+            # Flat dicts (e.g. one exercise) read best on a single line
+            if isinstance(item, dict) and not any(isinstance(v, (dict, list)) for v in item.values()):
+                lines.append(f"{pad}- " + ", ".join(f"{_title(k)}: {v}" for k, v in item.items()))
+            elif isinstance(item, (dict, list)):
+                lines.extend(_render_value(item, depth))
+            else:
+                lines.append(f"{pad}- {item}")
+    else:
+        lines.append(f"{pad}{value}")
+    return lines
+
+
+def render_template(tool_results: Dict[str, Any]) -> str:
+    """
+    Renders raw tool outputs as plain text without an LLM call.
+    Used when there is no time left for the summarization step.
+    """
+    lines = [TEMPLATE_HEADER]
+    for name, result in tool_results.items():
+        lines.append("")
+        lines.append(f"{_title(name)}:")
+        lines.extend(_render_value(result, 0))
+    return "\n".join(lines)
+
+
+def answer_from_messages(messages: List[Any]) -> Optional[Tuple[str, str]]:
+    """
+    Salvages an answer from an agent run that was cut short.
+    - Tool results already produced -> rendered as a template ("template").
+    - Otherwise the last non-empty AI text -> returned as-is ("partial").
+    Returns None if the run produced nothing usable.
+    """
+    tool_results = {}
+    for msg in messages:
+        if getattr(msg, "type", None) == "tool":
+            try:
+                tool_results[msg.name] = json.loads(msg.content)
+            except (TypeError, ValueError):
+                tool_results[msg.name] = msg.content
+    if tool_results:
+        return render_template(tool_results), "template"
+
+    for msg in reversed(messages):
+        if getattr(msg, "type", None) == "ai" and isinstance(msg.content, str) and msg.content.strip():
+            return msg.content, "partial"
+    return None
+
+
+def writes_note(writes: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Tells the user which writes a cut-short run still made, so they don't retry
+    (and double-log) a spend that was in fact recorded.
+    """
+    recorded = [w["what"] for w in writes if w["status"] == "recorded"]
+    pending = [w["what"] for w in writes if w["status"] == "pending"]
+    lines = []
+    if recorded:
+        lines.append("Note: despite the delay, this was recorded (no need to log it again): " + "; ".join(recorded) + ".")
+    if pending:
+        lines.append("Note: this may have been recorded, please check before logging it again: " + "; ".join(pending) + ".")
+    return "\n".join(lines) or None
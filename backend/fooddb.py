@@ -0,0 +1,469 @@
+import os
+import re
+import csv
+import sys
+import bisect
+import json
+import time
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+FOOD_CSV = os.getenv("FOOD_CSV", os.path.join(DATA_DIR, "foods.csv"))
+FOOD_DB = os.getenv("FOOD_DB", os.path.join(DATA_DIR, "foods.bin"))
+
+MAGIC = b"HOSSFOOD2"
+ALIGN = 64
+# Nutrient columns, per 100 g; unit_g is the weight of one piece/serving and cup_g of
+# one 240 ml cup (0 when unknown)
+NUTRIENTS = ["kcal", "protein_g", "carbs_g", "fat_g", "unit_g", "cup_g"]
+DEFAULT_UNIT_G = 100.0
+MIN_FUZZY_SCORE = 0.35
+# Fuzzy lookup: key-length bands (as Jaccard upper bounds) read before MIN_FUZZY_SCORE,
+# postings counted per pass, and per-trigram band size above which a trigram is skipped
+FUZZY_BANDS = (0.8, 0.7, 0.6, 0.5)
+FUZZY_BATCH_POSTINGS = 256
+FUZZY_COMMON_POSTINGS = 1000
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def trigrams(key: bytes) -> List[int]:
+    """Byte trigrams of " key ", packed into one int each."""
+    padded = b" " + key + b" "
+    return sorted({(padded[i] << 16) | (padded[i + 1] << 8) | padded[i + 2] for i in range(len(padded) - 2)})
+
+
+def _write_arrays(path: str, arrays: Dict[str, np.ndarray]):
+    """
+    Single-file columnar layout: MAGIC, 8-byte header length, JSON header
+    ({name: dtype/shape/offset}), then each array 64-byte aligned.
+    """
+    header, offset = {}, 0
+    for name, arr in arrays.items():
+        offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+        header[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = (len(MAGIC) + 8 + len(header_bytes) + ALIGN - 1) // ALIGN * ALIGN
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + header[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, path)
+
+
+def _map_arrays(path: str) -> Dict[str, np.ndarray]:
+    """Memory-maps every array in the file; only the small JSON header is parsed."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a food database file")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    data_start = (len(MAGIC) + 8 + header_len + ALIGN - 1) // ALIGN * ALIGN
+    return {
+        name: np.memmap(path, dtype=np.dtype(meta["dtype"]), mode="r",
+                        offset=data_start + meta["offset"], shape=tuple(meta["shape"]))
+        if int(np.prod(meta["shape"])) else np.empty(meta["shape"], dtype=np.dtype(meta["dtype"]))
+        for name, meta in header.items()
+    }
+
+
+def build_db(rows: List[Dict[str, Any]], path: str):
+    """
+    Builds the database from rows of {name, synonyms, kcal, protein_g, carbs_g, fat_g, unit_g, cup_g}.
+    - Every name and synonym is a lookup key; keys are stored sorted for binary/prefix search.
+    - A trigram inverted index (sorted codes + CSR postings of key ids) serves fuzzy matches.
+    """
+    nutrients = np.zeros((len(rows), len(NUTRIENTS)), dtype=np.float32)
+    keys: Dict[bytes, int] = {}
+    for food_id, row in enumerate(rows):
+        nutrients[food_id] = [float(row.get(n) or (DEFAULT_UNIT_G if n == "unit_g" else 0)) for n in NUTRIENTS]
+        for name in [row["name"]] + [s for s in (row.get("synonyms") or "").split("|") if s]:
+            key = normalize(name).encode("utf-8")
+            if key:
+                keys.setdefault(key, food_id)
+
+    sorted_keys = sorted(keys)
+    key_food = np.array([keys[k] for k in sorted_keys], dtype=np.int32)
+    lengths = np.array([len(k) for k in sorted_keys], dtype=np.int64)
+    key_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    key_blob = np.frombuffer(b"".join(sorted_keys), dtype=np.uint8)
+
+    # Canonical display name of each food: the key made from its "name" column
+    food_key = np.zeros(len(rows), dtype=np.int32)
+    key_index = {k: i for i, k in enumerate(sorted_keys)}
+    for food_id, row in enumerate(rows):
+        food_key[food_id] = key_index[normalize(row["name"]).encode("utf-8")]
+
+    gram_lists = [trigrams(k) for k in sorted_keys]
+    key_ngrams = np.array([len(g) for g in gram_lists], dtype=np.uint16)
+    all_codes = np.fromiter((c for g in gram_lists for c in g), dtype=np.uint32, count=int(key_ngrams.sum()))
+    all_keys = np.repeat(np.arange(len(sorted_keys), dtype=np.int32), key_ngrams)
+    all_lens = np.repeat(key_ngrams, key_ngrams)
+    # Postings of each trigram are ordered by the key's trigram count, so a lookup
+    # can slice out only the keys whose length could reach the similarity threshold
+    order = np.lexsort((all_keys, all_lens, all_codes))
+    gram_codes, counts = np.unique(all_codes[order], return_counts=True)
+    gram_ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    _write_arrays(path, {
+        "nutrients": nutrients,
+        "food_key": food_key,
+        "key_food": key_food,
+        "key_offsets": key_offsets,
+        "key_blob": key_blob,
+        "key_ngrams": key_ngrams,
+        "gram_codes": gram_codes.astype(np.uint32),
+        "gram_ptr": gram_ptr,
+        "gram_postings": all_keys[order],
+        "gram_posting_lens": all_lens[order],
+    })
+
+
+def read_csv(path: str) -> List[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class FoodDB:
+    """Read-only, memory-mapped food-composition database with exact, prefix and trigram lookup."""
+
+    def __init__(self, path: str):
+        a = _map_arrays(path)
+        self.nutrients = a["nutrients"]
+        self.food_key = a["food_key"]
+        self.key_food = a["key_food"]
+        self.key_offsets = a["key_offsets"]
+        self.key_blob = a["key_blob"]
+        self.key_ngrams = a["key_ngrams"]
+        self.gram_codes = a["gram_codes"]
+        self.gram_ptr = a["gram_ptr"]
+        self.gram_postings = a["gram_postings"]
+        self.gram_posting_lens = a["gram_posting_lens"]
+        self.n_keys = len(self.key_food)
+        # memoryviews index to plain ints/bytes, much cheaper than NumPy scalars in the binary search
+        self._blob = memoryview(self.key_blob)
+        self._offsets = memoryview(self.key_offsets).cast("B").cast("q") if self.n_keys else [0]
+        self._gram_codes = memoryview(self.gram_codes).cast("B").cast("I") if len(self.gram_codes) else []
+        self._gram_ptr = memoryview(self.gram_ptr).cast("B").cast("q")
+        # Plain ndarray view: slicing a np.memmap goes through its Python-level __getitem__
+        self._postings = np.asarray(self.gram_postings)
+        self._key_ngrams = np.asarray(self.key_ngrams)
+        self._gram_lens = memoryview(self.gram_posting_lens).cast("B").cast("H") if len(self.gram_posting_lens) else []
+
+    def key(self, i: int) -> bytes:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def food_name(self, food_id: int) -> str:
+        return self.key(int(self.food_key[food_id])).decode("utf-8")
+
+    def _lower_bound(self, term: bytes) -> int:
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def exact(self, term: bytes) -> Optional[int]:
+        i = self._lower_bound(term)
+        if i < self.n_keys and self.key(i) == term:
+            return i
+        return None
+
+    def prefix(self, term: bytes, limit: int = 8) -> Optional[int]:
+        """Shortest key among the first `limit` keys starting with `term`."""
+        i = self._lower_bound(term)
+        best = None
+        for j in range(i, min(i + limit, self.n_keys)):
+            k = self.key(j)
+            if not k.startswith(term):
+                break
+            if best is None or len(k) < len(self.key(best)):
+                best = j
+        return best
+
+    def fuzzy(self, term: bytes) -> Optional[Tuple[int, float]]:
+        """
+        Best trigram (Jaccard) match above MIN_FUZZY_SCORE.
+        - A key of L trigrams scores at most min(n, L) / max(n, L) against an n-trigram
+          query, and postings are ordered by L, so lists are read one length band at a time,
+          widening through FUZZY_BANDS down to MIN_FUZZY_SCORE. Reading stops as soon as the
+          best match beats every key outside the band read so far.
+        - Small bands are batched into one counting pass (FUZZY_BATCH_POSTINGS).
+        - A trigram with more than FUZZY_COMMON_POSTINGS keys in a band ("ed ", " co") is
+          dropped: it barely separates candidates and dominates the cost. Hit counts are then
+          a lower bound, so the winner is rescored exactly against its own trigrams.
+        """
+        query = trigrams(term)
+        n_query = len(query)
+        # Per trigram: [lo, hi) posting range and the [start, stop) part already read
+        lists = []
+        for code in query:
+            i = bisect.bisect_left(self._gram_codes, code)
+            if i < len(self._gram_codes) and self._gram_codes[i] == code:
+                lo, hi = self._gram_ptr[i], self._gram_ptr[i + 1]
+                start = bisect.bisect_left(self._gram_lens, n_query, lo, hi)
+                lists.append([lo, hi, start, start])
+        if not lists:
+            return None
+
+        best, best_score = None, 0.0
+        windows, pending = [], 0
+        for bound in FUZZY_BANDS + (MIN_FUZZY_SCORE,):
+            min_len, max_len = int(np.ceil(bound * n_query)), int(n_query / bound)
+            for posting in lists:
+                lo, hi, start, stop = posting
+                if lo == hi:
+                    continue
+                new_start = bisect.bisect_left(self._gram_lens, min_len, lo, start)
+                new_stop = bisect.bisect_right(self._gram_lens, max_len, stop, hi)
+                if new_stop - new_start > FUZZY_COMMON_POSTINGS:
+                    posting[0] = posting[1] = lo
+                    continue
+                # Only the lengths this band adds below and above the ones already read
+                if new_start < start:
+                    windows.append(self._postings[new_start:start])
+                if stop < new_stop:
+                    windows.append(self._postings[stop:new_stop])
+                pending += (start - new_start) + (new_stop - stop)
+                posting[2], posting[3] = new_start, new_stop
+
+            if pending < FUZZY_BATCH_POSTINGS and bound != MIN_FUZZY_SCORE:
+                continue
+            if windows:
+                candidates, hits = np.unique(np.concatenate(windows), return_counts=True)
+                scores = hits / (n_query + self._key_ngrams[candidates].astype(np.int32) - hits)
+                i = int(np.argmax(scores))
+                if scores[i] > best_score:
+                    best, best_score = int(candidates[i]), float(scores[i])
+                windows, pending = [], 0
+            if best_score >= bound:
+                break
+        if best is None:
+            return None
+
+        grams = trigrams(self.key(best))
+        shared = len(set(query).intersection(grams))
+        return best, shared / (n_query + len(grams) - shared)
+
+    def match(self, text: str) -> Optional[Dict[str, Any]]:
+        """Resolves free text to a food: exact (incl. simple plurals), then prefix, then fuzzy."""
+        term = normalize(text)
+        if not term:
+            return None
+        encoded = term.encode("utf-8")
+
+        for variant in [encoded, encoded[:-1] if encoded.endswith(b"s") else None,
+                        encoded[:-2] if encoded.endswith(b"es") else None]:
+            if variant:
+                key = self.exact(variant)
+                if key is not None:
+                    return self._result(key, "exact", 1.0)
+
+        if len(encoded) >= 3:
+            key = self.prefix(encoded)
+            if key is not None:
+                return self._result(key, "prefix", 1.0)
+
+        found = self.fuzzy(encoded)
+        if found and found[1] >= MIN_FUZZY_SCORE:
+            return self._result(found[0], "fuzzy", found[1])
+        return None
+
+    def _result(self, key: int, how: str, score: float) -> Dict[str, Any]:
+        food_id = int(self.key_food[key])
+        kcal, protein, carbs, fat, unit_g, cup_g = (float(v) for v in self.nutrients[food_id])
+        return {
+            "food_id": food_id,
+            "name": self.food_name(food_id),
+            "matched_key": self.key(key).decode("utf-8"),
+            "match": how,
+            "score": round(score, 2),
+            "per_100g": {"calories": kcal, "protein_g": protein, "carbs_g": carbs, "fat_g": fat},
+            "unit_g": unit_g,
+            "cup_g": cup_g or None,
+        }
+
+
+_db: Optional[FoodDB] = None
+_db_lock = threading.Lock()
+
+
+def get_db() -> FoodDB:
+    """Opens the mapped database on first use, (re)building it if missing, stale or outdated."""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                if not os.path.exists(FOOD_DB) or (
+                    os.path.exists(FOOD_CSV) and os.path.getmtime(FOOD_CSV) > os.path.getmtime(FOOD_DB)
+                ):
+                    build_db(read_csv(FOOD_CSV), FOOD_DB)
+                try:
+                    _db = FoodDB(FOOD_DB)
+                except (ValueError, KeyError):
+                    # Written by an older layout: rebuild once from the CSV
+                    build_db(read_csv(FOOD_CSV), FOOD_DB)
+                    _db = FoodDB(FOOD_DB)
+    return _db
+
+
+# Grams per unit; pieces/servings (or no unit) use the food's own unit_g
+UNIT_GRAMS = {
+    "g": 1, "gm": 1, "gms": 1, "gram": 1, "grams": 1,
+    "kg": 1000, "oz": 28.35, "scoop": 30, "scoops": 30,
+}
+# Millilitres per volume unit; grams come from the food's cup_g (its density)
+UNIT_ML = {
+    "ml": 1, "l": 1000, "litre": 1000, "liter": 1000,
+    "cup": 240, "cups": 240, "glass": 250, "glasses": 250, "bowl": 250, "bowls": 250,
+    "tbsp": 15, "tablespoon": 15, "tablespoons": 15, "tsp": 5, "teaspoon": 5, "teaspoons": 5,
+}
+CUP_ML = 240
+PIECE_UNITS = {"piece", "pieces", "slice", "slices", "serving", "servings", "plate", "plates"}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "half": 0.5,
+}
+FILLER_WORDS = {
+    "i", "ate", "had", "have", "eat", "eaten", "drank", "drink", "the", "of", "for", "some",
+    "today", "breakfast", "lunch", "dinner", "snack", "snacks", "calories", "calorie",
+    "nutrition", "in", "how", "many", "much", "what", "whats", "is", "are", "macros",
+    "my", "me", "about", "tell", "give", "was", "there", "total", "please",
+    "large", "small", "medium", "big",
+}
+ITEM_SPLIT = re.compile(r",|;|\+|\band\b|\bwith\b|\bplus\b|\n")
+QUANTITY = re.compile(
+    r"\b(?P<qty>\d+(?:\.\d+)?|" + "|".join(NUMBER_WORDS) + r")\s*"
+    r"(?P<unit>" + "|".join(sorted(set(UNIT_GRAMS) | set(UNIT_ML) | PIECE_UNITS, key=len, reverse=True)) + r")?\b"
+)
+
+
+def parse_items(userquery: str) -> List[Dict[str, Any]]:
+    """Splits a query into (quantity, unit, food text) items, e.g. "2 eggs and 150g rice"."""
+    items = []
+    for chunk in ITEM_SPLIT.split(userquery.lower()):
+        chunk = chunk.strip()
+        qty, unit = None, None
+        m = QUANTITY.search(chunk)
+        if m:
+            raw = m.group("qty")
+            qty = NUMBER_WORDS[raw] if raw in NUMBER_WORDS else float(raw)
+            unit = m.group("unit")
+            # Quantity may come before or after the food: "2 tbsp peanut butter" / "peanut butter 2 tbsp"
+            chunk = chunk[:m.start()] + " " + chunk[m.end():]
+        words = [w for w in normalize(chunk).split() if w not in FILLER_WORDS and w not in NUMBER_WORDS]
+        if words:
+            items.append({"quantity": qty, "unit": unit, "food": " ".join(words)})
+    return items
+
+
+def food_nutrition_lookup(userquery: str) -> Dict[str, Any]:
+    """
+    Nutritional breakdown of the foods mentioned in a query.
+    - Parses foods and quantities (e.g. "2 eggs, 1 cup milk and 150 g rice").
+    - Looks each food up in the local food-composition database.
+    - Volume units use the food's grams per cup; a food without one falls back to its
+      serving weight and the item is flagged "approximate".
+    - Returns per-item and summed calories, protein, carbs and fat.
+    """
+    db = get_db()
+    items, unmatched = [], []
+    totals = {"calories": 0.0, "protein_g": 0.0, "carbs_g": 0.0, "fat_g": 0.0}
+
+    for item in parse_items(userquery):
+        food = db.match(item["food"])
+        if food is None:
+            unmatched.append(item["food"])
+            continue
+
+        qty = item["quantity"] if item["quantity"] is not None else 1
+        approximate = False
+        if item["unit"] in UNIT_GRAMS:
+            grams = qty * UNIT_GRAMS[item["unit"]]
+        elif item["unit"] in UNIT_ML and food["cup_g"]:
+            grams = qty * UNIT_ML[item["unit"]] / CUP_ML * food["cup_g"]
+        elif item["unit"] in UNIT_ML:
+            grams, approximate = qty * food["unit_g"], True
+        else:
+            grams = qty * food["unit_g"]
+
+        factor = grams / 100
+        breakdown = {k: round(v * factor, 1) for k, v in food["per_100g"].items()}
+        for k, v in breakdown.items():
+            totals[k] += v
+        entry = {"query": item["food"], "food": food["name"], "match": food["match"], "grams": round(grams), **breakdown}
+        if approximate:
+            entry["approximate"] = True
+        items.append(entry)
+
+    return {
+        "items": items,
+        "unmatched": unmatched,
+        "totals": {k: round(v, 1) for k, v in totals.items()},
+        "note": "Values are approximate, per standard food-composition data.",
+    }
+
+
+if __name__ == "__main__":
+    # Lookup benchmark over a synthetic 150k-food database: python fooddb.py [n_foods]
+    import random
+    import tempfile
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 150000
+    rng = random.Random(7)
+    seed = read_csv(FOOD_CSV)
+    words = sorted({w for r in seed for w in normalize(r["name"] + " " + (r["synonyms"] or "").replace("|", " ")).split()})
+    styles = ["grilled", "baked", "fried", "steamed", "raw", "roasted", "spicy", "sweet", "organic", "homemade"]
+    rows = [dict(r) for r in seed]
+    while len(rows) < n:
+        base = rng.choice(seed)
+        name = f"{rng.choice(styles)} {rng.choice(words)} {base['name']} {len(rows)}"
+        rows.append({**base, "name": name, "synonyms": ""})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "foods.bin")
+        start = time.perf_counter()
+        build_db(rows, path)
+        print(f"build {len(rows):,} foods: {time.perf_counter() - start:.2f}s, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        db = FoodDB(path)
+        print(f"open (mmap, header only): {(time.perf_counter() - start) * 1e6:.0f} us")
+
+        def bench(label, terms):
+            start = time.perf_counter()
+            found = sum(db.match(t) is not None for t in terms)
+            print(f"{label}: {(time.perf_counter() - start) / len(terms) * 1e6:.1f} us/lookup ({found}/{len(terms)} matched)")
+
+        exact_terms = [rng.choice(rows)["name"] for _ in range(2000)]
+        bench("exact", exact_terms)
+        bench("prefix", [r["name"][:6] for r in seed] * 20)
+
+        def typo(s):
+            i = rng.randrange(1, len(s) - 1)
+            return s[:i] + s[i + 1:]
+        bench("fuzzy (1 typo)", [typo(r["name"]) for r in seed if len(r["name"]) > 4] * 20)
+
+        global_db = _db
+        _db = db
+        queries = ["2 eggs, 1 cup milk and 150g rice", "I had a banana with peanut butter", "3 rotis and dal"] * 300
+        start = time.perf_counter()
+        for q in queries:
+            food_nutrition_lookup(q)
+        print(f"food_nutrition_lookup: {(time.perf_counter() - start) / len(queries) * 1e6:.1f} us/query")
+        _db = global_db
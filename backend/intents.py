@@ -0,0 +1,179 @@
+import re
+import json
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+
+import deadline
+import profiler
+from llm import model
+from fallback import render_template
+from agents import nutrition_planner, fitness_trackker, sleep_optimizer, mental_wellness
+from fooddb import food_nutrition_lookup
+
+
+# Keyword patterns per intent; word-boundary anchored so "rest" doesn't match "interest".
+# Only unambiguous cues: words like "protein", "muscle", "strength", "training", "focus",
+# "gym" or "tired" show up in questions about another topic and would pull in unrelated
+# tools. "eat" and "vegan"/"vegetarian" only count next to a food or plan word.
+INTENT_PATTERNS = {
+    "food_lookup": re.compile(r"\b(how many (calories|kcal)|(calories|kcal|macros) (in|of|for)|how much (protein|carbs|fat|sugar) (in|is in|does)|nutrition(al)? (facts|info|value))\b"),
+    "nutrition": re.compile(
+        r"\b(meal|meals|diet|nutrition|calorie|calories|food|foods|macros?"
+        r"|(eat|eating) (healthy|healthier|clean|better|plan)"
+        r"|(vegan|vegetarian) (recipes?|options?|protein sources?))\b"
+    ),
+    "fitness": re.compile(r"\b(workout|workouts|exercise|exercises|split|lifting|cardio)\b"),
+    "sleep": re.compile(r"\b(sleep|sleeping|insomnia|bedtime|nap|naps)\b"),
+    "wellness": re.compile(r"\b(stress|stressed|anxiety|anxious|meditat\w*|mental|burnout|overwhelmed|mood)\b"),
+}
+
+# Pinned detections; `python intents.py --check` verifies them (no model calls)
+INTENT_EXAMPLES = {
+    "4 day workout split, focus on chest": ["fitness"],
+    "What should I eat to build muscle?": [],
+    "I want to eat healthier": ["nutrition"],
+    "I'm tired after workouts, what should I eat?": ["fitness"],
+    "I'm a vegan, give me a workout": ["fitness"],
+    "vegan meal plan, high protein for strength training": ["nutrition"],
+    "I can't sleep and I'm stressed about work": ["sleep", "wellness"],
+    "I want to lose fat: give me a meal plan, a workout split and better sleep": ["nutrition", "fitness", "sleep"],
+    "I spent 500 on a gym membership": [],
+    "How many calories in 2 eggs and a banana, I eat them before the gym": ["food_lookup"],
+    "calories in 150g rice and dal, and a vegan meal plan for the week": ["food_lookup", "nutrition"],
+}
+
+# A food lookup also trips the nutrition words ("calories", "eat"); the meal planner
+# only runs alongside it when a plan is actually asked for
+MEAL_PLAN_PATTERN = re.compile(r"\b(meal|meals|diet|plan|plans)\b")
+
+# Wrapped as LangChain tools so the RunnableConfig (user_id) is injected exactly as in the agent
+INTENT_TOOLS = {
+    "food_lookup": StructuredTool.from_function(profiler.profiled_tool(food_nutrition_lookup)),
+    "nutrition": StructuredTool.from_function(profiler.profiled_tool(nutrition_planner)),
+    "fitness": StructuredTool.from_function(profiler.profiled_tool(fitness_trackker)),
+    "sleep": StructuredTool.from_function(profiler.profiled_tool(sleep_optimizer)),
+    "wellness": StructuredTool.from_function(profiler.profiled_tool(mental_wellness)),
+}
+
+# Spends need structured arguments from the model, so they always go through the agent
+SPEND_PATTERN = re.compile(r"(₹|\brs\.?\s*\d|\b(spent|paid|spend|bought|log)\b)")
+
+SUMMARY_PROMPT = (
+    "You are a holistic Health Assistant. The user asked several things at once and "
+    "each specialist tool has already run. Combine the tool results below into ONE "
+    "friendly, well-organised answer with a short section per topic. "
+    "Only use the data provided.\n\n"
+    "User query: {query}\n\n"
+    "Tool results (JSON):\n{results}"
+)
+
+
+def detect_intents(userquery: str) -> List[str]:
+    """
+    Returns every health intent mentioned in the query, in a stable order.
+    Spending queries return an empty list so the caller falls back to the agent.
+    """
+    q = userquery.lower()
+    if SPEND_PATTERN.search(q):
+        return []
+    intents = [name for name, pattern in INTENT_PATTERNS.items() if pattern.search(q)]
+    if "food_lookup" in intents and "nutrition" in intents and not MEAL_PLAN_PATTERN.search(q):
+        intents.remove("nutrition")
+    return intents
+
+
+async def run_tools_parallel(userquery: str, intents: List[str], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """
+    Runs the tool for each intent concurrently (sync tools run in worker threads).
+    A failing or late tool is reported in its slot instead of failing the whole request.
+    """
+    timeout = deadline.remaining()
+
+    async def run_one(name):
+        try:
+            return await asyncio.wait_for(
+                INTENT_TOOLS[name].ainvoke({"userquery": userquery}, config=config),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            return {"error": "timed out"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    results = await asyncio.gather(*(run_one(name) for name in intents))
+    return dict(zip(intents, results))
+
+
+async def run_multi_intent(userquery: str, intents: List[str], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """
+    One-step multi-intent path:
+    1. Dispatch all relevant tools at once.
+    2. Merge their outputs with a single summarization call.
+    If the summary can't finish before the request deadline, the raw tool
+    results are rendered as a template instead ("degraded": "template").
+    """
+    tool_results = await run_tools_parallel(userquery, intents, config)
+    prompt = SUMMARY_PROMPT.format(query=userquery, results=json.dumps(tool_results, indent=2, ensure_ascii=False))
+
+    current = deadline.current()
+    try:
+        summary = await asyncio.wait_for(
+            model.ainvoke(prompt),
+            timeout=current.remaining_for_work() if current else None
+        )
+        response, degraded = summary.content, None
+    except Exception as e:
+        print(f"Summary step failed, rendering template: {e!r}")
+        response, degraded = render_template(tool_results), "template"
+
+    return {
+        "response": response,
+        "intents": intents,
+        "tool_results": tool_results,
+        "degraded": degraded,
+    }
+
+
+def check_intent_examples() -> List[str]:
+    """Returns a description of every pinned example whose detection changed."""
+    return [
+        f"{query!r}: expected {expected}, got {detect_intents(query)}"
+        for query, expected in INTENT_EXAMPLES.items()
+        if detect_intents(query) != expected
+    ]
+
+
+if __name__ == "__main__":
+    # python intents.py --check: pinned intent detections only
+    # python intents.py: latency comparison against the sequential ReAct loop
+    # Needs GOOGLE_API_KEY; the agent path may fail on the recursion limit, which is reported.
+    import sys
+    import time
+
+    failures = check_intent_examples()
+    for failure in failures:
+        print(f"intent mismatch: {failure}")
+    if failures or (len(sys.argv) > 1 and sys.argv[1] == "--check"):
+        sys.exit(1 if failures else 0)
+
+    from main import health_agent
+
+    query = "I want to lose fat: give me a meal plan, a workout split and better sleep"
+    intents = detect_intents(query)
+    print(f"Detected intents: {intents}")
+
+    start = time.perf_counter()
+    asyncio.run(run_multi_intent(query, intents))
+    print(f"parallel + 1 summary call: {time.perf_counter() - start:.2f}s")
+
+    for limit in [5, 25]:
+        start = time.perf_counter()
+        try:
+            health_agent.invoke({"messages": [("user", query)]}, config={"recursion_limit": limit})
+            outcome = "ok"
+        except Exception as e:
+            outcome = f"failed ({type(e).__name__})"
+        print(f"sequential ReAct (recursion_limit={limit}): {time.perf_counter() - start:.2f}s, {outcome}")
@@ -1,19 +1,31 @@
 from llm import model
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import os
-from typing import Literal, Dict, Any
+from typing import Literal, Dict, Any, Optional
 import re
+import time
+import asyncio
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI
 from langgraph.prebuilt import create_react_agent
 from langgraph_supervisor import create_supervisor
 from langgraph.checkpoint.memory import InMemorySaver
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import FileResponse
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 import psycopg2
 #from agents import nutrition_agent, fitness_agent, sleep_agent, wellness_agent, spending_agent
 from agents import fitness_trackker, nutrition_planner, sleep_optimizer, mental_wellness, log_health_spend
+from fooddb import food_nutrition_lookup
+from intents import detect_intents, run_multi_intent, run_tools_parallel
+from fallback import render_template, answer_from_messages, writes_note, FALLBACK_TEXT
+import deadline
+import metrics
+import profiler
+from profiles import profile_cache
+from sleepdata import SleepIngestor
+from storage import load_sleep_summary
 
 # check_llm = model.invoke("what is breakfast?")
 # print(f"LLM Check Response: {check_llm.content}")
@@ -23,6 +35,17 @@ app = FastAPI(title="Health Supervisor API")
 
 class UserQuery(BaseModel):
     query: str
+    # Required: spends, profiles and sleep data are all stored per user
+    user_id: str = Field(..., min_length=1)
+
+
+class UserProfile(BaseModel):
+    # Bounded so a typo can't reach storage and turn into negative targets
+    age: int = Field(..., gt=0, le=120)
+    sex: Literal["male", "female", "other"]
+    weight_kg: float = Field(..., gt=0, le=400)
+    height_cm: float = Field(..., gt=0, le=260)
+    activity_level: Literal["sedentary", "light", "moderate", "active", "very_active"] = "light"
 
 # 1. Load Environment Variables
 load_dotenv()
@@ -393,17 +416,19 @@ load_dotenv()
 # #memory = InMemorySaver()
 # graph_app = workflow.compile()
 
-HEALTH_TOOLS = [
+HEALTH_TOOLS = [profiler.profiled_tool(t) for t in [
     nutrition_planner, 
+    food_nutrition_lookup,
     fitness_trackker, 
     sleep_optimizer, 
     mental_wellness, 
     log_health_spend
-]
+]]
 
 SYSTEM_PROMPT = (
     "You are a holistic Health Assistant. You have access to specialized tools "
-    "for nutrition, fitness, sleep, mental wellness, and spending tracking. "
+    "for nutrition (meal plans and calorie/macro breakdowns of specific foods), "
+    "fitness, sleep, mental wellness, and spending tracking. "
     "\n1. Identify what the user needs. "
     "\n2. Call the single most relevant tool to get data. "
     "\n3. Summarize the tool's output into a friendly, helpful response. "
@@ -421,38 +446,171 @@ health_agent = create_react_agent(
 
 #graph_app = health_agent.compile()
 
-@app.post("/chat")
-async def chat_endpoint(request: UserQuery):
-    try:
-        print(f"Received query: {request.query}")
-        #config = {"configurable": {"thread_id": "1"},"recursion_limit": 10}
-        config = {"recursion_limit": 5}
-        print("--- Natural Language Health App Started ---")
-        # result = graph_app.invoke({
-        #     "messages": [{
-        #         "role": "user", 
-        #         "content": request.query
-        #     }]
-        # }, config=config)
-        result = health_agent.invoke({
-            "messages": [("user", request.query)]
-        }, config=config)
-
+def _respond(body: Dict[str, Any], degraded: Optional[str], started: float) -> Dict[str, Any]:
+    """Adds the degradation path to the response and records it in metrics."""
+    metrics.incr(f"chat_degraded_{degraded}" if degraded else "chat_full_answer")
+    metrics.observe_ms("chat_latency", (time.perf_counter() - started) * 1000)
+    body["degraded"] = degraded
+    return body
+
+
+async def degraded_answer(query: str, messages: list, config: Dict[str, Any]):
+    """
+    Best answer we can still give once the agent failed or ran out of time:
+    1. Whatever the agent already produced (tool results or partial text).
+    2. The rule-based tools for the detected intents, rendered as a template.
+    3. A static apology.
+    """
+    salvaged = answer_from_messages(messages)
+    if salvaged:
+        return salvaged
+
+    intents = detect_intents(query)
+    if intents:
+        tool_results = await run_tools_parallel(query, intents, config)
+        if any("error" not in r for r in tool_results.values()):
+            return render_template(tool_results), "template"
+    return FALLBACK_TEXT, "fallback"
+
+
+async def settle_writes(request_deadline: deadline.Deadline) -> Optional[str]:
+    """
+    A cancelled agent leaves its sync tools running in worker threads. Waits (within
+    the reserve) for writes they already started, then says which ones landed.
+    """
+    while any(w["status"] == "pending" for w in request_deadline.writes) and request_deadline.remaining() > 0.02:
+        await asyncio.sleep(0.01)
+    return writes_note(request_deadline.writes)
 
-        # Extract the final response
-        if "messages" in result and len(result["messages"]) > 0:
-            last_msg = result["messages"][-1]
-            return {
-                "response": last_msg.content,
 
-            }
-        else:
-            return {"response": "No response generated."}
+@app.post("/chat")
+async def chat_endpoint(request: UserQuery, x_request_deadline_ms: Optional[str] = Header(default=None)):
+    # Every LLM call, tool and DB access below reads this deadline from the context
+    request_deadline = deadline.start(deadline.budget_from_header(x_request_deadline_ms))
+    started = time.perf_counter()
+    metrics.incr("chat_requests")
+
+    print(f"Received query: {request.query}")
+    #config = {"configurable": {"thread_id": "1"},"recursion_limit": 10}
+    # user_id reaches tools through the injected RunnableConfig, not the prompt
+    config = {"recursion_limit": 5, "configurable": {"user_id": request.user_id}}
+    print("--- Natural Language Health App Started ---")
+
+    # Several topics in one query: run their tools together and summarize once
+    intents = detect_intents(request.query)
+    if len(intents) > 1:
+        print(f"Multi-intent query, running in parallel: {intents}")
+        result = await run_multi_intent(request.query, intents, config)
+        return _respond({
+            "response": result["response"],
+            "intents": result["intents"],
+        }, result["degraded"], started)
+
+    # result = graph_app.invoke({
+    #     "messages": [{
+    #         "role": "user", 
+    #         "content": request.query
+    #     }]
+    # }, config=config)
+
+    # Stream the agent's states so a run cut short still leaves its messages behind
+    progress = {"messages": []}
+
+    async def run_agent():
+        async for state in health_agent.astream({
+            "messages": [("user", request.query)]
+        }, config=config, stream_mode="values"):
+            progress["messages"] = state.get("messages", [])
 
+    try:
+        await asyncio.wait_for(run_agent(), timeout=request_deadline.remaining_for_work())
     except Exception as e:
-        print(f"Detailed Error: {e}")
-        raise HTTPException(status_code=500, detail="The agent is taking too many steps. Try a simpler query.")
-
+        # Recursion limit, slow provider or the request deadline: degrade instead of a 500
+        print(f"Detailed Error: {e!r}")
+        response, degraded = await degraded_answer(request.query, progress["messages"], config)
+        note = await settle_writes(request_deadline)
+        if note:
+            response = f"{response}\n\n{note}"
+        return _respond({"response": response}, degraded, started)
+
+    # Extract the final response
+    if len(progress["messages"]) > 0:
+        last_msg = progress["messages"][-1]
+        return _respond({
+            "response": last_msg.content,
+        }, None, started)
+    else:
+        return _respond({"response": "No response generated."}, None, started)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return {**metrics.snapshot(), "profile_cache": profile_cache.stats()}
+
+
+@app.put("/profile/{user_id}")
+async def update_user_profile(user_id: str, profile: UserProfile):
+    # Write-through: storage first, then the cached targets are replaced
+    entry = await asyncio.to_thread(profile_cache.update, user_id, profile.model_dump())
+    return {"user_id": user_id, **entry}
+
+
+@app.get("/profile/{user_id}")
+async def get_user_profile(user_id: str):
+    entry = await asyncio.to_thread(profile_cache.get, user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No profile saved for this user.")
+    return {"user_id": user_id, **entry}
+
+
+@app.post("/sleep/{user_id}/upload")
+async def upload_sleep_export(user_id: str, request: Request, format: Optional[str] = None, tz: Optional[str] = None):
+    """
+    Streams a wearable sleep export (CSV, JSON array or JSON Lines) into per-night stats.
+    The body is parsed as it arrives, so long exports never sit in memory.
+    Exports with epoch timestamps need `tz` (e.g. Europe/Berlin or +05:30).
+    """
+    fmt = format or ("json" if "json" in request.headers.get("content-type", "") else "csv")
+    started = time.perf_counter()
+    try:
+        ingestor = await asyncio.to_thread(SleepIngestor, user_id, fmt, tz)
+        async for chunk in request.stream():
+            await asyncio.to_thread(ingestor.feed, chunk)
+        result = await asyncio.to_thread(ingestor.finish)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metrics.incr("sleep_samples_ingested", result["rows"])
+    metrics.observe_ms("sleep_upload_ms", (time.perf_counter() - started) * 1000)
+    return {"user_id": user_id, **result}
+
+
+@app.get("/sleep/{user_id}/summary")
+async def get_sleep_summary(user_id: str):
+    summary = await asyncio.to_thread(load_sleep_summary, user_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No sleep data uploaded for this user.")
+    return {"user_id": user_id, **summary}
+
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    if not profiler.is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+    return {"profiles": profiler.list_profiles()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: str = "speedscope"):
+    """Download a profile: format=speedscope (open in speedscope.app) or format=folded (flamegraph.pl)."""
+    if not profiler.is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+    path = profiler.find_profile(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=os.path.basename(path))
+
+# Pure ASGI: only POST /chat is ever profiled, other routes are passed straight through
+app.add_middleware(profiler.ChatProfileMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # In production, replace with your frontend URL
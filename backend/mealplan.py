@@ -0,0 +1,213 @@
+"""
+Weekly meal plans from the meal catalog (data/meals.csv), scored against calorie/macro targets.
+
+Size limits: the catalog index holds every breakfast x lunch x dinner combination
+(B*L*D rows) and every set of up to MAX_SNACKS snacks (S sets, ~n^2/2 for n snacks).
+plan_week prefilters mains to MAIN_PREFILTER_SIZE before scoring them against every
+snack set, so a request costs about MAIN_PREFILTER_SIZE * S * 4 floats: ~15 MB for
+30 snacks (466 sets), but ~160 MB for 100 snacks. Snack catalogs beyond a few dozen
+items per diet need their own shortlist.
+"""
+import os
+import csv
+import time
+import functools
+import itertools
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from fooddb import DATA_DIR
+
+
+MEAL_CSV = os.getenv("MEAL_CSV", os.path.join(DATA_DIR, "meals.csv"))
+
+MAIN_SLOTS = ["breakfast", "lunch", "dinner"]
+MACROS = ["calories", "protein_g", "carbs_g", "fat_g"]
+# Which catalog diet tags each diet type may eat
+DIET_ALLOWS = {
+    "vegan": {"vegan"},
+    "vegetarian": {"vegan", "vegetarian"},
+    "flexible": {"vegan", "vegetarian", "flexible"},
+}
+MAX_SNACKS = 2
+# Main-meal portions are scaled per day to close the calorie gap, in quarter steps
+MIN_PORTION, MAX_PORTION, PORTION_STEP = 0.75, 1.5, 0.25
+# Only the best main combinations for the target are searched day by day
+SHORTLIST_SIZE = 400
+# Main combinations kept (scored without snacks) before the (mains x snack sets) cross product
+MAIN_PREFILTER_SIZE = 1000
+MAX_REPEATS_PER_WEEK = 2
+# Cost = weighted relative miss per macro + variety penalties
+COST_WEIGHTS = np.array([4.0, 2.0, 1.0, 1.0])
+REPEAT_PENALTY = 0.08
+BACK_TO_BACK_PENALTY = 0.25
+TIE_BREAK_JITTER = 0.01
+
+
+def default_macro_targets(calories: float) -> Dict[str, float]:
+    """25% protein, 50% carbs, 25% fat when no profile-derived macros exist."""
+    return {
+        "calories": calories,
+        "protein_g": round(calories * 0.25 / 4),
+        "carbs_g": round(calories * 0.50 / 4),
+        "fat_g": round(calories * 0.25 / 9),
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def load_catalog() -> List[Dict[str, Any]]:
+    with open(MEAL_CSV, newline="", encoding="utf-8") as f:
+        return [
+            {
+                "slot": r["slot"], "name": r["name"], "diet": r["diet"],
+                "macros": [float(r["kcal"]), float(r["protein_g"]), float(r["carbs_g"]), float(r["fat_g"])],
+            }
+            for r in csv.DictReader(f)
+        ]
+
+
+@functools.lru_cache(maxsize=None)
+def candidate_index(diet_type: str) -> Dict[str, Any]:
+    """
+    Diet-filtered candidates, built once per diet type:
+    - every breakfast x lunch x dinner combination with its summed macros,
+    - every snack set of 0..MAX_SNACKS snacks with its summed macros.
+    """
+    allowed = DIET_ALLOWS.get(diet_type, DIET_ALLOWS["flexible"])
+    meals = [m for m in load_catalog() if m["diet"] in allowed]
+    slots = {s: [m for m in meals if m["slot"] == s] for s in MAIN_SLOTS + ["snack"]}
+    slot_macros = {s: np.array([m["macros"] for m in rows]).reshape(-1, 4) for s, rows in slots.items()}
+
+    b, l, d = (np.arange(len(slots[s])) for s in MAIN_SLOTS)
+    bi, li, di = (a.ravel() for a in np.meshgrid(b, l, d, indexing="ij"))
+    main_sums = slot_macros["breakfast"][bi] + slot_macros["lunch"][li] + slot_macros["dinner"][di]
+
+    n_snacks = len(slots["snack"])
+    snack_sets = [()] + [c for k in range(1, MAX_SNACKS + 1) for c in itertools.combinations(range(n_snacks), k)]
+    snack_members = np.zeros((len(snack_sets), n_snacks))
+    for i, combo in enumerate(snack_sets):
+        snack_members[i, list(combo)] = 1
+    snack_sums = snack_members @ slot_macros["snack"] if n_snacks else np.zeros((1, 4))
+
+    return {
+        "slots": slots,
+        "main_index": np.stack([bi, li, di]),
+        "main_sums": main_sums,
+        "snack_sets": snack_sets,
+        "snack_members": snack_members,
+        "snack_sums": snack_sums,
+    }
+
+
+def plan_week(target: Dict[str, float], diet_type: str, days: int = 7, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Picks meals for `days` days so each day's totals track the calorie/macro target.
+    - Base cost of every (main combo, snack set) pair is computed once, vectorized,
+      with main-meal portions scaled (0.75x-1.5x) towards the calorie target.
+    - Days are filled greedily; meals already used cost more, a meal or snack can't
+      appear more than MAX_REPEATS_PER_WEEK times, and the same main meal on
+      consecutive days is penalized.
+    - `seed` adds a tiny tie-break jitter so users with equal targets get different weeks.
+    """
+    start = time.perf_counter()
+    idx = candidate_index(diet_type)
+    main_index, main_sums, snack_sums = idx["main_index"], idx["main_sums"], idx["snack_sums"]
+    goal = np.array([max(1.0, float(target[m])) for m in MACROS])
+
+    # Prefilter main combinations against the target less a typical snack set, so the
+    # cross product below stays MAIN_PREFILTER_SIZE x snack sets whatever the catalog size
+    if len(main_sums) > MAIN_PREFILTER_SIZE:
+        rest = np.maximum(1.0, goal - np.median(snack_sums, axis=0))
+        solo = np.clip(np.round(rest[0] / main_sums[:, 0] / PORTION_STEP) * PORTION_STEP, MIN_PORTION, MAX_PORTION)
+        solo_cost = (np.abs(solo[:, None] * main_sums - rest) / rest) @ COST_WEIGHTS
+        keep = np.argpartition(solo_cost, MAIN_PREFILTER_SIZE)[:MAIN_PREFILTER_SIZE]
+        main_index, main_sums = main_index[:, keep], main_sums[keep]
+
+    # Portion that brings each (main combo, snack set) closest to the calorie target
+    portion = (goal[0] - snack_sums[None, :, 0]) / main_sums[:, None, 0]
+    portion = np.clip(np.round(portion / PORTION_STEP) * PORTION_STEP, MIN_PORTION, MAX_PORTION)
+    totals = portion[:, :, None] * main_sums[:, None, :] + snack_sums[None, :, :]
+    base = (np.abs(totals - goal) / goal) @ COST_WEIGHTS
+
+    rng = np.random.default_rng(seed)
+    slot_sizes = [len(idx["slots"][s]) for s in MAIN_SLOTS]
+    jitter = sum(rng.uniform(0, TIE_BREAK_JITTER, n)[main_index[k]] for k, n in enumerate(slot_sizes))
+    base = base + jitter[:, None]
+
+    # Shortlist main combinations whose best snack pairing is good; keeps each day's search small
+    if len(base) > SHORTLIST_SIZE:
+        keep = np.argpartition(base.min(axis=1), SHORTLIST_SIZE)[:SHORTLIST_SIZE]
+        main_index, base, totals, portion = main_index[:, keep], base[keep], totals[keep], portion[keep]
+
+    uses = [np.zeros(n) for n in slot_sizes]
+    snack_uses = np.zeros(idx["snack_members"].shape[1])
+    prev = None
+    plan = []
+    for day in range(days):
+        main_uses = sum(uses[k][main_index[k]] for k in range(3))
+        penalty = REPEAT_PENALTY * main_uses
+        blocked = np.zeros(len(penalty), dtype=bool)
+        for k in range(3):
+            blocked |= uses[k][main_index[k]] >= MAX_REPEATS_PER_WEEK
+            if prev is not None:
+                penalty = penalty + BACK_TO_BACK_PENALTY * (main_index[k] == prev[k])
+        snack_penalty = REPEAT_PENALTY / 2 * (idx["snack_members"] @ snack_uses)
+        # The empty snack set is never blocked, so a day always has an option
+        snack_blocked = idx["snack_members"] @ (snack_uses >= MAX_REPEATS_PER_WEEK) > 0
+
+        cost = base + penalty[:, None] + snack_penalty[None, :]
+        if not blocked.all():  # small catalogs: allow repeats rather than fail
+            cost[blocked] = np.inf
+        cost[:, snack_blocked] = np.inf
+        m, s = np.unravel_index(int(np.argmin(cost)), cost.shape)
+
+        chosen = [int(main_index[k][m]) for k in range(3)]
+        for k in range(3):
+            uses[k][chosen[k]] += 1
+        snack_uses += idx["snack_members"][s]
+        prev = chosen
+
+        day_totals = totals[m, s]
+        plan.append({
+            "day": day + 1,
+            **{slot: idx["slots"][slot][chosen[k]]["name"] for k, slot in enumerate(MAIN_SLOTS)},
+            "snacks": [idx["slots"]["snack"][i]["name"] for i in idx["snack_sets"][s]],
+            "main_meal_portion": float(portion[m, s]),
+            "totals": {macro: round(float(v)) for macro, v in zip(MACROS, day_totals)},
+        })
+
+    errors = np.array([[abs(d["totals"][m] - goal[i]) / goal[i] for i, m in enumerate(MACROS)] for d in plan])
+    distinct = {d[slot] for d in plan for slot in MAIN_SLOTS}
+    return {
+        "days": plan,
+        "quality": {
+            "avg_calorie_error_pct": round(float(errors[:, 0].mean()) * 100, 1),
+            "max_calorie_error_pct": round(float(errors[:, 0].max()) * 100, 1),
+            "avg_protein_error_pct": round(float(errors[:, 1].mean()) * 100, 1),
+            "distinct_main_meals": len(distinct),
+            "solve_ms": round((time.perf_counter() - start) * 1000, 2),
+        },
+    }
+
+
+if __name__ == "__main__":
+    # Latency and plan quality across diets and calorie targets: python mealplan.py
+    for diet in DIET_ALLOWS:
+        candidate_index(diet)  # warm the per-diet index, as a long-running server would
+
+    for diet in DIET_ALLOWS:
+        latencies, cal_err, max_err, distinct = [], [], [], []
+        for i, kcal in enumerate(range(1400, 3401, 50)):
+            week = plan_week(default_macro_targets(kcal), diet, seed=i)
+            q = week["quality"]
+            latencies.append(q["solve_ms"])
+            cal_err.append(q["avg_calorie_error_pct"])
+            max_err.append(q["max_calorie_error_pct"])
+            distinct.append(q["distinct_main_meals"])
+        lat = np.array(latencies)
+        print(
+            f"{diet:11s} p50 {np.percentile(lat, 50):.1f} ms, p95 {np.percentile(lat, 95):.1f} ms, "
+            f"max {lat.max():.1f} ms | calorie error avg {np.mean(cal_err):.1f}% "
+            f"(worst day {max(max_err):.1f}%) | distinct mains/week {np.mean(distinct):.1f}"
+        )
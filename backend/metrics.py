@@ -0,0 +1,31 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+
+# In-process counters and latency sums, exposed as JSON on GET /metrics
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_timings: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+
+def incr(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe_ms(name: str, ms: float):
+    with _lock:
+        t = _timings[name]
+        t["count"] += 1
+        t["total_ms"] += ms
+        t["max_ms"] = max(t["max_ms"], ms)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        timings = {
+            name: {**t, "avg_ms": t["total_ms"] / t["count"] if t["count"] else 0.0}
+            for name, t in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
@@ -0,0 +1,347 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import asyncio
+import weakref
+import functools
+import threading
+import contextvars
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+
+
+# Opt-in only: an admin header on the request, or a random sample of /chat traffic
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+PROFILE_HEADER = "x-profile"
+ADMIN_HEADER = "x-admin-token"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+# Sampler of the request being profiled; copied into the tasks and tool threads it starts
+_active: contextvars.ContextVar = contextvars.ContextVar("profile_sampler", default=None)
+
+
+def is_admin(headers) -> bool:
+    # Constant-time comparison: this header guards profile downloads
+    token = headers.get(ADMIN_HEADER)
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def should_profile(headers) -> bool:
+    """Cheap check done on every request; costs a header lookup when profiling is off."""
+    if headers.get(PROFILE_HEADER) and is_admin(headers):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """
+    Wall-clock stack sampler for the duration of one request.
+    - A background thread snapshots stacks with sys._current_frames().
+    - The event loop thread is only sampled while one of this request's tasks is running on it
+      (graph overhead, serialization); time the loop spends idle or on other requests is left out.
+    - Worker threads are only sampled while they run one of this request's tools (see profiled_tool).
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.frames: List[Tuple[str, str, int]] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        # thread id -> list of (stack as frame indexes root->leaf, weight in ms)
+        self.samples: Dict[int, List[Tuple[Tuple[int, ...], float]]] = {}
+        self.thread_names: Dict[int, str] = {}
+        self.tasks = weakref.WeakSet()
+        self.threads = set()
+        self.loop = None
+        self.loop_thread = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.started_at = 0.0
+        self.duration_ms = 0.0
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        idx = self._frame_index.get(key)
+        if idx is None:
+            idx = len(self.frames)
+            self._frame_index[key] = idx
+            self.frames.append(key)
+        return idx
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight = (now - last) * 1000
+            last = now
+            for tid, frame in sys._current_frames().items():
+                if tid == own_id:
+                    continue
+                if tid == self.loop_thread:
+                    if asyncio.current_task(self.loop) not in self.tasks:
+                        continue
+                elif tid not in self.threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.setdefault(tid, []).append((tuple(stack), weight))
+
+    def start(self):
+        """Called from the request's task; returns the token for stop()."""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.tasks.add(asyncio.current_task())
+        _track_tasks(self.loop)
+        token = _active.set(self)
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return token
+
+    def stop(self, token):
+        _active.reset(token)
+        self._stop.set()
+        self._thread.join()
+        self.duration_ms = (time.perf_counter() - self.started_at) * 1000
+        self.thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        profiles = []
+        for tid, samples in self.samples.items():
+            profiles.append({
+                "type": "sampled",
+                "name": self.thread_names.get(tid, f"thread {tid}"),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(w for _, w in samples),
+                "samples": [list(stack) for stack, _ in samples],
+                "weights": [round(w, 3) for _, w in samples],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "healthoss-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": n, "file": f, "line": l} for n, f, l in self.frames]},
+            "profiles": profiles,
+        }
+
+    def to_folded(self) -> str:
+        """Collapsed-stack text ("a;b;c weight"), the input format of flamegraph.pl."""
+        counts = Counter()
+        for tid, samples in self.samples.items():
+            thread = self.thread_names.get(tid, f"thread {tid}").replace(";", ":")
+            for stack, weight in samples:
+                names = [thread] + [f"{self.frames[i][0]} ({os.path.basename(self.frames[i][1])})" for i in stack]
+                counts[";".join(names)] += weight
+        return "\n".join(f"{stack} {max(1, round(ms))}" for stack, ms in counts.items()) + "\n"
+
+
+class ChatProfileMiddleware:
+    """
+    Pure ASGI middleware that profiles POST /chat when should_profile() says so.
+    Every other route (streaming uploads included) is passed straight through without wrapping.
+    The response carries X-Profile-Id; the files are written right after the response has been sent.
+    """
+
+    path = "/chat"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        if not should_profile(headers):
+            return await self.app(scope, receive, send)
+
+        profile_id = new_profile_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        sampler = StackSampler()
+        token = sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(token)
+        await asyncio.to_thread(save, sampler, f"{scope['method']} {self.path}", profile_id)
+        metrics.incr("chat_profiles_captured")
+
+
+def _track_tasks(loop):
+    """Task factory that adds tasks created under a profiled request to its sampler (installed once per loop)."""
+    previous = loop.get_task_factory()
+    if getattr(previous, "tracks_profiled_tasks", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        sampler = context.get(_active) if context is not None else _active.get()
+        if sampler is not None:
+            sampler.tasks.add(task)
+        return task
+
+    factory.tracks_profiled_tasks = True
+    loop.set_task_factory(factory)
+
+
+def profiled_tool(fn):
+    """
+    Tool wrapper: while a profiled request runs the tool, its worker thread is sampled.
+    Executor threads inherit the request's context (asyncio.to_thread, langchain's run_in_executor).
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        sampler = _active.get()
+        if sampler is None:
+            return fn(*args, **kwargs)
+        tid = threading.get_ident()
+        sampler.threads.add(tid)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.threads.discard(tid)
+    return wrapper
+
+
+def new_profile_id() -> str:
+    return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+
+def save(sampler: StackSampler, label: str, profile_id: str) -> str:
+    """Writes <id>.speedscope.json and <id>.folded to PROFILE_DIR, returns the profile id."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    with open(base + ".speedscope.json", "w") as f:
+        json.dump(sampler.to_speedscope(f"{label} ({sampler.duration_ms:.0f} ms)"), f)
+    with open(base + ".folded", "w") as f:
+        f.write(sampler.to_folded())
+    _prune()
+    return profile_id
+
+
+def _prune():
+    ids = list_profiles()
+    for old in ids[PROFILE_MAX_FILES:]:
+        for path in profile_paths(old).values():
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles() -> List[str]:
+    """Profile ids, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = {f.split(".", 1)[0] for f in os.listdir(PROFILE_DIR) if f.endswith(".speedscope.json")}
+    return sorted(ids, key=lambda i: int(i.split("-", 1)[0]), reverse=True)
+
+
+def profile_paths(profile_id: str) -> Dict[str, str]:
+    base = os.path.join(PROFILE_DIR, profile_id)
+    return {"speedscope": base + ".speedscope.json", "folded": base + ".folded"}
+
+
+def find_profile(profile_id: str, fmt: str) -> Optional[str]:
+    """Path to a stored profile, or None for unknown ids/formats (ids are validated, no path traversal)."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = profile_paths(profile_id).get(fmt)
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+if __name__ == "__main__":
+    # Middleware overhead with profiling off and on, on a stand-in ASGI app: python profiler.py
+    import tempfile
+    import statistics
+
+    def cpu_work(ms: float):
+        end = time.perf_counter() + ms / 1000
+        while time.perf_counter() < end:
+            pass
+
+    def other_request_work(ms: float):
+        cpu_work(ms)
+
+    tool = profiled_tool(cpu_work)
+    other_tool = profiled_tool(other_request_work)
+
+    async def empty_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def tool_app(scope, receive, send):
+        await asyncio.to_thread(tool if scope["path"] == "/chat" else other_tool, 20)
+        await empty_app(scope, receive, send)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(path: str, profile: bool):
+        headers = [(b"content-type", b"application/json")]
+        if profile:
+            headers += [(PROFILE_HEADER.encode(), b"1"), (ADMIN_HEADER.encode(), ADMIN_TOKEN.encode())]
+        return {"type": "http", "method": "POST", "path": path, "headers": headers}
+
+    async def per_request_us(app, request_scope, n: int) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            await app(request_scope, receive, send)
+        return (time.perf_counter() - start) / n * 1e6
+
+    async def latency_ms(app, request_scope, n: int) -> float:
+        times = []
+        for _ in range(n):
+            start = time.perf_counter()
+            # A concurrent, unprofiled request runs its own tool at the same time
+            await asyncio.gather(app(request_scope, receive, send), app(scope("/other", False), receive, send))
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times)
+
+    async def main():
+        n = 20000
+        bare = await per_request_us(empty_app, scope("/chat", False), n)
+        wrapped = ChatProfileMiddleware(empty_app)
+        off = await per_request_us(wrapped, scope("/chat", False), n)
+        other = await per_request_us(wrapped, scope("/sleep/upload", False), n)
+        print(f"profiling off: bare app {bare:.1f} us/request, /chat {off:.1f} us, other routes {other:.1f} us")
+
+        wrapped = ChatProfileMiddleware(tool_app)
+        off_ms = await latency_ms(wrapped, scope("/chat", False), 20)
+        on_ms = await latency_ms(wrapped, scope("/chat", True), 20)
+        print(f"20 ms tool request: {off_ms:.2f} ms median with profiling off, {on_ms:.2f} ms on (incl. writing the profile)")
+
+        latest = list_profiles()[0]
+        with open(profile_paths(latest)["folded"]) as f:
+            folded = f.read()
+        print(f"last profile: {sum(1 for _ in folded.splitlines())} stacks, "
+              f"cpu_work seen: {'cpu_work' in folded}, other request's tool seen: {'other_request_work' in folded}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        PROFILE_DIR = tmp
+        ADMIN_TOKEN = ADMIN_TOKEN or "bench-token"
+        asyncio.run(main())
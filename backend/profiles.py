@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import storage
+
+
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+
+# Daily calorie adjustment and protein per kg of body weight for each nutrition goal
+GOAL_KCAL_ADJUSTMENT = {"weight_loss": -400, "maintenance": 0, "weight_gain": 300}
+GOAL_PROTEIN_G_PER_KG = {"weight_loss": 2.0, "maintenance": 1.6, "weight_gain": 1.8}
+FAT_SHARE_OF_KCAL = 0.25
+MIN_TARGET_KCAL = 1200
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+# Entries expire so updates made through another API worker are picked up;
+# "no profile" expires sooner, since that is what a first PUT /profile changes
+PROFILE_CACHE_TTL_S = float(os.getenv("PROFILE_CACHE_TTL_S", "300"))
+PROFILE_NEGATIVE_TTL_S = float(os.getenv("PROFILE_NEGATIVE_TTL_S", "10"))
+
+
+def bmr_mifflin_st_jeor(age: float, sex: str, weight_kg: float, height_cm: float) -> float:
+    """Basal metabolic rate (kcal/day). Unknown sex uses the midpoint of the two offsets."""
+    base = 10 * weight_kg + 6.25 * height_cm - 5 * age
+    if sex == "male":
+        return base + 5
+    if sex == "female":
+        return base - 161
+    return base - 78
+
+
+def derive_targets(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Computes everything the planners need from a profile, once:
+    - BMR (Mifflin-St Jeor) and TDEE (BMR x activity factor).
+    - Calorie and macro targets (grams) for every nutrition goal.
+    """
+    bmr = bmr_mifflin_st_jeor(profile["age"], profile.get("sex"), profile["weight_kg"], profile["height_cm"])
+    tdee = bmr * ACTIVITY_FACTORS.get(profile.get("activity_level"), ACTIVITY_FACTORS["light"])
+
+    targets = {}
+    for goal, adj in GOAL_KCAL_ADJUSTMENT.items():
+        kcal = max(MIN_TARGET_KCAL, round(tdee + adj))
+        protein_g = round(GOAL_PROTEIN_G_PER_KG[goal] * profile["weight_kg"])
+        fat_g = round(kcal * FAT_SHARE_OF_KCAL / 9)
+        carbs_g = max(0, round((kcal - protein_g * 4 - fat_g * 9) / 4))
+        targets[goal] = {"calories": kcal, "protein_g": protein_g, "carbs_g": carbs_g, "fat_g": fat_g}
+
+    return {"bmr": round(bmr), "tdee": round(tdee), "targets": targets}
+
+
+class ProfileCache:
+    """
+    Write-through, in-process LRU cache of profiles and their derived targets.
+    - update() writes storage first, then replaces the cached entry.
+    - get() serves from memory; a miss loads from the user's shard once.
+    - Users without a profile are cached too, so they don't hit storage every request.
+    Each API worker has its own cache. Updates on the same process are seen
+    immediately; other workers see them once their entry expires
+    (PROFILE_NEGATIVE_TTL_S for "no profile", PROFILE_CACHE_TTL_S otherwise).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE, ttl_s: float = PROFILE_CACHE_TTL_S,
+                 negative_ttl_s: float = PROFILE_NEGATIVE_TTL_S):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        # user_id -> (entry, expires_at on the monotonic clock)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_ns = 0
+        self.miss_ns = 0
+        # Bumped by every write; a miss loaded before a concurrent write must not be cached
+        self._generation = 0
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _store(self, user_id: str, entry: Optional[Dict[str, Any]]):
+        ttl = self.ttl_s if entry is not None else self.negative_ttl_s
+        self._entries[user_id] = (entry, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        self._evict()
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {"profile": ..., "derived": ...}, or None if the user has no profile."""
+        start = time.perf_counter_ns()
+        with self._lock:
+            cached = self._entries.get(user_id, self._MISSING)
+            if cached is not self._MISSING and cached[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                self.hit_ns += time.perf_counter_ns() - start
+                return cached[0]
+            generation = self._generation
+
+        profile = storage.load_profile(user_id)
+        entry = {"profile": profile, "derived": derive_targets(profile)} if profile else None
+        with self._lock:
+            if generation == self._generation:
+                self._store(user_id, entry)
+            self.misses += 1
+            self.miss_ns += time.perf_counter_ns() - start
+        return entry
+
+    def update(self, user_id: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+        storage.save_profile(user_id, profile)
+        entry = {"profile": dict(profile), "derived": derive_targets(profile)}
+        with self._lock:
+            self._generation += 1
+            self._store(user_id, entry)
+        return entry
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_hit_us": self.hit_ns / self.hits / 1000 if self.hits else 0.0,
+                "avg_miss_us": self.miss_ns / self.misses / 1000 if self.misses else 0.0,
+            }
+
+
+profile_cache = ProfileCache()
+
+
+if __name__ == "__main__":
+    # Hit rate and per-lookup cost with a SQLite stand-in shard: python profiles.py
+    import random
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage._router = storage.ShardRouter([f"sqlite:///{tmp}/shard0.db"])
+        cache = ProfileCache(max_size=2000)
+        for i in range(5000):
+            storage.save_profile(f"user{i}", {
+                "age": 20 + i % 50, "sex": "female" if i % 2 else "male",
+                "weight_kg": 55 + i % 40, "height_cm": 155 + i % 35, "activity_level": "moderate",
+            })
+
+        # Skewed traffic: a small set of active users makes most requests
+        users = [f"user{min(4999, int(random.paretovariate(1.2)) - 1)}" for _ in range(100000)]
+        start = time.perf_counter()
+        for user_id in users:
+            cache.get(user_id)
+        elapsed = time.perf_counter() - start
+
+        uncached = time.perf_counter()
+        for user_id in users[:2000]:
+            derive_targets(storage.load_profile(user_id))
+        uncached_us = (time.perf_counter() - uncached) / 2000 * 1e6
+
+        print(cache.stats())
+        print(f"cached: {elapsed / len(users) * 1e6:.1f} us/request, uncached: {uncached_us:.1f} us/request")
@@ -0,0 +1,527 @@
+import os
+import csv
+import sys
+import json
+import time
+import codecs
+import datetime
+import zoneinfo
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+import storage
+
+
+CHUNK_ROWS = int(os.getenv("SLEEP_CHUNK_ROWS", "65536"))
+SUMMARY_NIGHTS = int(os.getenv("SLEEP_SUMMARY_NIGHTS", "28"))
+READ_BLOCK_BYTES = 1 << 20
+
+# Exports are minute-level: each sample stands for one minute in bed
+SAMPLE_MINUTES = 1.0
+# A longer gap between samples starts a new session; each night keeps its longest
+SESSION_GAP_MINUTES = 90
+MIN_SLEEP_MINUTES = 120
+# Nights run noon to noon, so a 23:30 bedtime and a 00:30 bedtime land on the same night
+NIGHT_OFFSET_S = 12 * 3600
+CONSISTENCY_WINDOW = 7
+# Friday and Saturday nights (Monday = 0) are free nights for social jet lag
+FREE_NIGHTS = (4, 5)
+
+# Stage codes: 0 awake, 1 light, 2 deep, 3 REM. Unknown stages count as awake.
+STAGE_CODES = {
+    "awake": 0, "wake": 0, "w": 0, "restless": 0, "out_of_bed": 0,
+    "light": 1, "core": 1, "n1": 1, "n2": 1, "asleep": 1, "sleep": 1,
+    "deep": 2, "n3": 2,
+    "rem": 3,
+}
+TIMESTAMP_KEYS = ["timestamp", "time", "ts", "datetime", "start"]
+STAGE_KEYS = ["stage", "sleep_stage", "level", "state"]
+HR_KEYS = ["heart_rate", "hr", "bpm", "heartrate"]
+
+
+def _pick(names: List[str], candidates: List[str]) -> Optional[int]:
+    for key in candidates:
+        if key in names:
+            return names.index(key)
+    return None
+
+
+def parse_tz(name: str) -> datetime.tzinfo:
+    """An IANA zone ("Europe/Berlin") or a fixed UTC offset ("+05:30", "-0800")."""
+    text = name.strip()
+    # A "+" left unencoded in a query string arrives as a space
+    if text[:1].isdigit():
+        text = "+" + text
+    try:
+        return zoneinfo.ZoneInfo(text)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        pass
+    try:
+        return datetime.datetime.strptime(text, "%z").tzinfo
+    except ValueError:
+        raise ValueError(f"Unknown timezone {name!r}: use an IANA name like Europe/Berlin or an offset like +05:30")
+
+
+def parse_timestamps(values, tz: Optional[datetime.tzinfo] = None) -> np.ndarray:
+    """
+    Local wall-clock seconds since the epoch.
+    - ISO strings keep their wall time; any UTC offset or fraction is dropped.
+    - Numbers are UTC epoch seconds (milliseconds if they look like it) and are shifted
+      to wall time in `tz`, DST included. Without a tz they are rejected: read as wall
+      time they would move every night by the user's UTC offset.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind not in "iuf":
+        try:
+            arr = arr.astype(np.float64)
+        except ValueError:
+            return arr.astype("U19").astype("datetime64[s]").astype(np.int64)
+    if tz is None:
+        raise ValueError("Numeric (epoch) timestamps are UTC: pass the export's timezone (tz=Europe/Berlin or tz=+05:30)")
+    arr = arr.astype(np.float64)
+    epoch = np.where(arr > 1e11, arr / 1000, arr).astype(np.int64)
+    # Offsets only change on quarter-hour boundaries; look each one up once per chunk
+    quarters, inverse = np.unique(epoch // 900, return_inverse=True)
+    offsets = np.array([
+        datetime.datetime.fromtimestamp(int(q) * 900, tz).utcoffset().total_seconds() for q in quarters
+    ], dtype=np.int64)
+    return epoch + offsets[inverse.ravel()]
+
+
+def parse_stages(values) -> np.ndarray:
+    # Only the distinct labels are mapped in Python
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    mapped = np.array([STAGE_CODES.get(u.strip().lower(), 0) for u in uniques], dtype=np.int8)
+    return mapped[inverse.ravel()]
+
+
+def parse_heart_rate(values) -> np.ndarray:
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iuf":
+        return arr.astype(np.float64)
+    arr = arr.astype(str)
+    return np.where(arr == "", "nan", arr).astype(np.float64)
+
+
+def nightly_metrics(ts: np.ndarray, stage: np.ndarray, hr: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-night metrics from time-ordered samples, in one vectorized pass:
+    - Samples split into sessions at gaps over SESSION_GAP_MINUTES and at noon;
+      each night keeps its longest sleep session, so naps are dropped.
+    - Time in bed counts the session's samples; latency runs from the first sample
+      to the first asleep one; the session ends at the last asleep minute.
+    - Midpoint is minutes after noon of the night's date, so it doesn't wrap at midnight.
+    """
+    n = len(ts)
+    if n == 0:
+        return {"night": np.zeros(0, dtype=np.int64)}
+    idx = np.arange(n)
+    night = (ts - NIGHT_OFFSET_S) // 86400
+    new_session = np.ones(n, dtype=bool)
+    new_session[1:] = (np.diff(ts) > SESSION_GAP_MINUTES * 60) | (np.diff(night) != 0)
+    starts = np.flatnonzero(new_session)
+    ends = np.r_[starts[1:], n]
+    session = np.cumsum(new_session) - 1
+
+    asleep = stage > 0
+    sleep_count = np.add.reduceat(asleep.astype(np.int32), starts)
+    first_sleep = np.minimum.reduceat(np.where(asleep, idx, n - 1), starts)
+    last_sleep = np.maximum.reduceat(np.where(asleep, idx, 0), starts)
+
+    # Awakenings: asleep -> awake transitions before the final wake-up
+    wake_begins = np.zeros(n, dtype=bool)
+    wake_begins[1:] = asleep[:-1] & ~asleep[1:] & ~new_session[1:]
+    awakenings = np.add.reduceat((wake_begins & (idx < last_sleep[session])).astype(np.int32), starts)
+
+    sleep_hr = np.where(asleep, hr, np.nan)
+    has_hr = ~np.isnan(sleep_hr)
+    hr_sum = np.add.reduceat(np.where(has_hr, sleep_hr, 0.0), starts)
+    hr_count = np.add.reduceat(has_hr.astype(np.int32), starts)
+    min_hr = np.fmin.reduceat(sleep_hr, starts)
+
+    # Main session per night: the one with the most sleep, if it's long enough
+    session_night = night[starts]
+    order = np.lexsort((sleep_count, session_night))
+    last_of_night = np.r_[session_night[order][1:] != session_night[order][:-1], True]
+    main = order[last_of_night]
+    main = main[sleep_count[main] * SAMPLE_MINUTES >= MIN_SLEEP_MINUTES]
+
+    bed_start = ts[starts[main]]
+    onset = ts[first_sleep[main]]
+    wake = ts[last_sleep[main]] + int(SAMPLE_MINUTES * 60)
+    in_bed = (ends[main] - starts[main]) * SAMPLE_MINUTES
+    slept = sleep_count[main] * SAMPLE_MINUTES
+    nights = session_night[main]
+    noon = nights * 86400 + NIGHT_OFFSET_S
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_hr = hr_sum[main] / hr_count[main]
+
+    return {
+        "night": nights,
+        "bed_start": bed_start,
+        "sleep_onset": onset,
+        "wake_time": wake,
+        "time_in_bed_min": in_bed,
+        "total_sleep_min": slept,
+        "efficiency": slept / in_bed,
+        "latency_min": (onset - bed_start) / 60,
+        "deep_min": np.add.reduceat((stage == 2).astype(np.int32), starts)[main] * SAMPLE_MINUTES,
+        "rem_min": np.add.reduceat((stage == 3).astype(np.int32), starts)[main] * SAMPLE_MINUTES,
+        "awakenings": awakenings[main],
+        "avg_sleep_hr": avg_hr,
+        "min_sleep_hr": min_hr[main],
+        "midpoint_min": ((onset + wake) / 2 - noon) / 60,
+        # 1970-01-01 was a Thursday
+        "is_free_day": np.isin((nights + 3) % 7, FREE_NIGHTS),
+    }
+
+
+def regularity(midpoint: np.ndarray, is_free: np.ndarray, prev_midpoint: np.ndarray, prev_free: np.ndarray):
+    """
+    Per-night consistency and social jet lag against the previous CONSISTENCY_WINDOW nights
+    (earlier nights come from `prev_*`, so the window spans chunks and uploads):
+    - consistency_min: distance of the midpoint from the window's mean midpoint.
+    - social_jet_lag_min: midpoint minus the window's mean work-night midpoint (later = positive).
+    NaN when the window has no usable nights.
+    """
+    mid = np.r_[prev_midpoint, midpoint].astype(np.float64)
+    work = (~np.r_[prev_free, is_free].astype(bool)).astype(np.float64)
+    cum_mid = np.r_[0.0, np.cumsum(mid)]
+    cum_work_mid = np.r_[0.0, np.cumsum(mid * work)]
+    cum_work = np.r_[0.0, np.cumsum(work)]
+
+    i = np.arange(len(prev_midpoint), len(mid))
+    lo = np.maximum(0, i - CONSISTENCY_WINDOW)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        window_mean = (cum_mid[i] - cum_mid[lo]) / (i - lo)
+        work_mean = (cum_work_mid[i] - cum_work_mid[lo]) / (cum_work[i] - cum_work[lo])
+    return np.abs(mid[i] - window_mean), mid[i] - work_mean
+
+
+def _iso(seconds: np.ndarray) -> List[str]:
+    return [str(s) for s in seconds.astype("datetime64[s]")]
+
+
+def _number(value, digits: int = 1):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def _clock(minutes_after_noon: float) -> str:
+    minutes = int(round(minutes_after_noon + 12 * 60)) % (24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def summarize(nights: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Per-user summary over stored nights (most recent SUMMARY_NIGHTS), what the sleep tool reads:
+    - Averages of the nightly metrics, typical bedtime and wake time.
+    - midpoint_std_min: night-to-night spread of mid-sleep (lower = more regular).
+    - social_jet_lag_min: |mean free-night midpoint - mean work-night midpoint|.
+    """
+    if not nights:
+        return None
+
+    def col(name):
+        return np.array([np.nan if n[name] is None else n[name] for n in nights], dtype=np.float64)
+
+    night_noon = np.array([n["night"] for n in nights], dtype="datetime64[D]") + np.timedelta64(12, "h")
+    onset = (np.array([n["sleep_onset"] for n in nights], dtype="datetime64[s]") - night_noon).astype(np.float64) / 60
+    wake = (np.array([n["wake_time"] for n in nights], dtype="datetime64[s]") - night_noon).astype(np.float64) / 60
+    midpoint = col("midpoint_min")
+    free = col("is_free_day") > 0
+
+    jet_lag = abs(np.mean(midpoint[free]) - np.mean(midpoint[~free])) if free.any() and (~free).any() else np.nan
+    return {
+        "nights": len(nights),
+        "first_night": str(nights[0]["night"]),
+        "last_night": str(nights[-1]["night"]),
+        "avg_sleep_min": _number(np.nanmean(col("total_sleep_min"))),
+        "avg_time_in_bed_min": _number(np.nanmean(col("time_in_bed_min"))),
+        "avg_efficiency": _number(np.nanmean(col("efficiency")), 3),
+        "avg_latency_min": _number(np.nanmean(col("latency_min"))),
+        "avg_deep_min": _number(np.nanmean(col("deep_min"))),
+        "avg_rem_min": _number(np.nanmean(col("rem_min"))),
+        "avg_awakenings": _number(np.nanmean(col("awakenings"))),
+        "avg_sleep_hr": _number(np.nanmean(col("avg_sleep_hr"))) if not np.isnan(col("avg_sleep_hr")).all() else None,
+        "avg_bedtime": _clock(onset.mean()),
+        "avg_wake_time": _clock(wake.mean()),
+        "midpoint_std_min": _number(np.std(midpoint)),
+        "social_jet_lag_min": _number(jet_lag),
+    }
+
+
+def sleep_insights(summary: Dict[str, Any], min_hours: float) -> List[str]:
+    """Tips driven by the user's own numbers, most important first."""
+    tips = []
+    avg_hours = summary["avg_sleep_min"] / 60
+    if avg_hours < min_hours:
+        tips.append(f"You average {avg_hours:.1f} h of sleep; try moving bedtime earlier to reach at least {min_hours:g} h.")
+    if summary["avg_latency_min"] is not None and summary["avg_latency_min"] > 30:
+        tips.append("You usually take over 30 minutes to fall asleep; go to bed only when sleepy and keep the last hour screen-free.")
+    if summary["avg_efficiency"] is not None and summary["avg_efficiency"] < 0.85:
+        tips.append(f"Sleep efficiency is {summary['avg_efficiency']:.0%} (aim for 85%+); limit time awake in bed.")
+    if summary["social_jet_lag_min"] is not None and summary["social_jet_lag_min"] > 60:
+        tips.append(f"Weekend sleep is shifted by about {summary['social_jet_lag_min'] / 60:.1f} h (social jet lag); keep weekend wake-up within an hour of weekdays.")
+    if summary["midpoint_std_min"] is not None and summary["midpoint_std_min"] > 60:
+        tips.append("Your sleep timing varies by more than an hour night to night; a fixed wake-up time helps most.")
+    return tips
+
+
+class SleepIngestor:
+    """
+    Push-based, chunked ingestion of one user's wearable sleep export.
+    - Formats: CSV with a header row, or JSON (an array of sample objects, or JSON Lines).
+      Samples need a timestamp and a stage; heart rate is optional. Exports are expected
+      in time order and to cover time in bed, as wearable sleep exports do.
+    - feed() takes raw bytes as they arrive; rows are parsed and analysed CHUNK_ROWS at a time.
+    - The last (possibly unfinished) night of each chunk is carried into the next one; finished
+      nights are written to the user's shard straight away.
+    - Epoch timestamps need `tz` (IANA name or UTC offset) to be placed on the user's nights.
+    - finish() flushes the last night and refreshes the stored summary.
+    Memory stays at one chunk plus one night, whatever the length of the export.
+    """
+
+    def __init__(self, user_id: str, fmt: str = "csv", tz: Optional[str] = None):
+        if fmt not in ("csv", "json"):
+            raise ValueError(f"Unsupported sleep export format: {fmt}")
+        self.user_id = str(user_id)
+        self.fmt = fmt
+        self.tz = parse_tz(tz) if tz else None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json = json.JSONDecoder()
+        self._text = ""
+        self._columns: Optional[List] = None
+        self._keys: Optional[List] = None
+        self._ts: List = []
+        self._stage: List = []
+        self._hr: List = []
+        self._carry = None
+        # The previous nights seed the consistency window
+        recent = storage.load_sleep_nights(self.user_id, CONSISTENCY_WINDOW)
+        self._prev_mid = np.array([n["midpoint_min"] for n in recent], dtype=np.float64)
+        self._prev_free = np.array([bool(n["is_free_day"]) for n in recent], dtype=bool)
+        self.rows = 0
+        self.nights = 0
+        self.skipped = 0
+
+    def _set_columns(self, names: List[str]):
+        names = [str(n).strip().lower() for n in names]
+        ts, stage, hr = _pick(names, TIMESTAMP_KEYS), _pick(names, STAGE_KEYS), _pick(names, HR_KEYS)
+        if ts is None or stage is None:
+            raise ValueError("Sleep export needs a timestamp and a stage column.")
+        self._columns = [ts, stage, hr]
+
+    def feed(self, data: bytes):
+        self._text += self._decoder.decode(data)
+        if self.fmt == "csv":
+            self._feed_csv()
+        else:
+            self._feed_json()
+        if len(self._ts) >= CHUNK_ROWS:
+            self._process(final=False)
+
+    def _feed_csv(self):
+        cut = self._text.rfind("\n")
+        if cut < 0:
+            return
+        rows = [r for r in csv.reader(self._text[:cut].splitlines()) if r]
+        self._text = self._text[cut + 1:]
+        if self._columns is None and rows:
+            self._set_columns(rows[0])
+            rows = rows[1:]
+        if not rows:
+            return
+        ts, stage, hr = self._columns
+        width = max(c for c in self._columns if c is not None) + 1
+        complete = rows
+        if min(map(len, rows)) < width:
+            complete = [r for r in rows if len(r) >= width]
+            self.skipped += len(rows) - len(complete)
+        # Transpose in C rather than appending cell by cell
+        cols = list(zip(*complete))
+        if cols:
+            self._ts.extend(cols[ts])
+            self._stage.extend(cols[stage])
+            self._hr.extend(cols[hr] if hr is not None else [""] * len(complete))
+
+    def _feed_json(self):
+        text, pos = self._text, 0
+        while True:
+            # Skip whitespace and the array's brackets/commas between sample objects
+            while pos < len(text) and text[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos >= len(text):
+                break
+            try:
+                record, end = self._json.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break  # partial object: wait for more bytes
+            pos = end
+            if not isinstance(record, dict):
+                self.skipped += 1
+                continue
+            if self._columns is None:
+                keys = list(record)
+                self._set_columns(keys)
+                self._keys = [keys[c] if c is not None else None for c in self._columns]
+            ts_key, stage_key, hr_key = self._keys
+            if record.get(ts_key) is None or record.get(stage_key) is None:
+                self.skipped += 1
+                continue
+            self._ts.append(record[ts_key])
+            self._stage.append(record[stage_key])
+            hr = record.get(hr_key) if hr_key else None
+            self._hr.append("" if hr is None else hr)
+        self._text = text[pos:]
+
+    def _process(self, final: bool):
+        if self._ts:
+            ts = parse_timestamps(self._ts, self.tz)
+            stage = parse_stages(self._stage)
+            hr = parse_heart_rate(self._hr)
+            self.rows += len(ts)
+            self._ts, self._stage, self._hr = [], [], []
+        else:
+            ts, stage, hr = np.zeros(0, np.int64), np.zeros(0, np.int8), np.zeros(0)
+        if self._carry is not None:
+            ts, stage, hr = (np.concatenate(pair) for pair in zip(self._carry, (ts, stage, hr)))
+            self._carry = None
+        if len(ts) and np.any(np.diff(ts) < 0):
+            order = np.argsort(ts, kind="stable")
+            ts, stage, hr = ts[order], stage[order], hr[order]
+
+        if not final and len(ts):
+            # The chunk's last night may continue in the next chunk
+            night = (ts - NIGHT_OFFSET_S) // 86400
+            split = int(np.searchsorted(night, night[-1]))
+            self._carry = (ts[split:], stage[split:], hr[split:])
+            ts, stage, hr = ts[:split], stage[:split], hr[:split]
+
+        m = nightly_metrics(ts, stage, hr)
+        if not len(m["night"]):
+            return
+        m["consistency_min"], m["social_jet_lag_min"] = regularity(
+            m["midpoint_min"], m["is_free_day"], self._prev_mid, self._prev_free
+        )
+        self._prev_mid = np.r_[self._prev_mid, m["midpoint_min"]][-CONSISTENCY_WINDOW:]
+        self._prev_free = np.r_[self._prev_free, m["is_free_day"]][-CONSISTENCY_WINDOW:]
+
+        nights = [str(d) for d in m["night"].astype("datetime64[D]")]
+        times = {k: _iso(m[k]) for k in ["bed_start", "sleep_onset", "wake_time"]}
+        rows = []
+        for i, night in enumerate(nights):
+            rows.append({
+                "night": night,
+                **{k: v[i] for k, v in times.items()},
+                "time_in_bed_min": _number(m["time_in_bed_min"][i]),
+                "total_sleep_min": _number(m["total_sleep_min"][i]),
+                "efficiency": _number(m["efficiency"][i], 3),
+                "latency_min": _number(m["latency_min"][i]),
+                "deep_min": _number(m["deep_min"][i]),
+                "rem_min": _number(m["rem_min"][i]),
+                "awakenings": int(m["awakenings"][i]),
+                "avg_sleep_hr": _number(m["avg_sleep_hr"][i]),
+                "min_sleep_hr": _number(m["min_sleep_hr"][i]),
+                "midpoint_min": _number(m["midpoint_min"][i]),
+                "consistency_min": _number(m["consistency_min"][i]),
+                "social_jet_lag_min": _number(m["social_jet_lag_min"][i]),
+                "is_free_day": int(m["is_free_day"][i]),
+            })
+        storage.save_sleep_nights(self.user_id, rows)
+        self.nights += len(rows)
+
+    def finish(self) -> Dict[str, Any]:
+        """Flushes the remaining samples and stores the refreshed summary."""
+        self._text += self._decoder.decode(b"", final=True)
+        if self.fmt == "csv":
+            self._text += "\n"
+            self._feed_csv()
+        else:
+            self._feed_json()
+            if self._text.strip():
+                raise ValueError("Sleep export ends with an incomplete or malformed JSON record.")
+        if self._columns is None:
+            raise ValueError("Sleep export is empty.")
+        self._process(final=True)
+
+        summary = summarize(storage.load_sleep_nights(self.user_id, SUMMARY_NIGHTS))
+        if summary:
+            storage.save_sleep_summary(self.user_id, summary)
+        return {"rows": self.rows, "nights": self.nights, "skipped_rows": self.skipped, "summary": summary}
+
+
+def ingest_file(user_id: str, path: str, fmt: Optional[str] = None, tz: Optional[str] = None) -> Dict[str, Any]:
+    """Streams an export from disk in READ_BLOCK_BYTES blocks; format from the extension by default."""
+    fmt = fmt or ("json" if path.endswith((".json", ".jsonl", ".ndjson")) else "csv")
+    ingestor = SleepIngestor(user_id, fmt, tz)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_BYTES)
+            if not block:
+                break
+            ingestor.feed(block)
+    return ingestor.finish()
+
+
+def _synthetic_export(path: str, days: int, fmt: str, seed: int = 7):
+    """Minute-level in-bed samples: later, longer weekend nights, stage cycles, brief awakenings."""
+    rng = np.random.default_rng(seed)
+    stage_names = np.array(["awake", "light", "deep", "rem"])
+    cycle = np.array([1] * 20 + [2] * 35 + [1] * 15 + [3] * 20)
+    start_day = np.datetime64("2024-01-01T00:00:00", "s").astype(np.int64)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("timestamp,stage,heart_rate\n" if fmt == "csv" else "[\n")
+        first = True
+        for d in range(days):
+            weekend = d % 7 in FREE_NIGHTS  # 2024-01-01 was a Monday
+            bed = start_day + d * 86400 + int((22.75 + rng.normal(0, 0.4) + (1.25 if weekend else 0)) * 3600)
+            latency = int(rng.integers(3, 35))
+            asleep = int(rng.normal(450 if weekend else 420, 30))
+            stages = np.r_[np.zeros(latency, int), np.resize(cycle, asleep), np.zeros(int(rng.integers(2, 15)), int)]
+            wakes = rng.random(len(stages)) < 0.01
+            stages[latency:latency + asleep][wakes[latency:latency + asleep]] = 0
+            ts = (bed + np.arange(len(stages)) * 60).astype("datetime64[s]")
+            hr = np.where(stages > 0, rng.normal(56, 3, len(stages)), rng.normal(66, 4, len(stages))).round()
+            if fmt == "csv":
+                f.writelines(f"{t},{stage_names[s]},{h:.0f}\n" for t, s, h in zip(ts, stages, hr))
+            else:
+                for t, s, h in zip(ts, stages, hr):
+                    f.write(("" if first else ",\n") + f'{{"timestamp": "{t}", "stage": "{stage_names[s]}", "heart_rate": {h:.0f}}}')
+                    first = False
+        if fmt == "json":
+            f.write("\n]\n")
+
+
+if __name__ == "__main__":
+    # Ingestion throughput on months of synthetic minute-level data: python sleepdata.py [days]
+    import tempfile
+    import tracemalloc
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    with tempfile.TemporaryDirectory() as tmp:
+        storage._router = storage.ShardRouter([f"sqlite:///{tmp}/shard0.db"])
+        for fmt in ["csv", "json"]:
+            path = os.path.join(tmp, f"export.{fmt}")
+            _synthetic_export(path, days, fmt)
+            size_mb = os.path.getsize(path) / 1e6
+
+            start = time.perf_counter()
+            result = ingest_file(f"bench-{fmt}", path)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{fmt:4s} {result['rows']:,} samples / {result['nights']} nights ({size_mb:.1f} MB): "
+                f"{result['rows'] / elapsed:,.0f} samples/s, {size_mb / elapsed:.1f} MB/s"
+            )
+
+        # Peak memory should not grow with the length of the export
+        for n_days in [days, days * 4]:
+            path = os.path.join(tmp, f"mem{n_days}.csv")
+            _synthetic_export(path, n_days, "csv")
+            tracemalloc.start()
+            ingest_file(f"mem-{n_days}", path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"peak memory, {n_days} nights: {peak / 1e6:.1f} MB")
+        print(result["summary"])
@@ -1,6 +1,16 @@
 import React, { useState, useRef, useEffect } from 'react';
 import './App.css';
 
+// The backend stores spends, profiles and sleep data per user; keep one id per browser
+function getUserId() {
+  let userId = localStorage.getItem('healthoss_user_id');
+  if (!userId) {
+    userId = crypto.randomUUID();
+    localStorage.setItem('healthoss_user_id', userId);
+  }
+  return userId;
+}
+
 function App() {
   const [messages, setMessages] = useState([
     { role: 'assistant', content: 'Hello! I am your Health Assistant. How can I help you today?' }
@@ -26,7 +36,7 @@ function App() {
       const response = await fetch('http://127.0.0.1:8080/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query: input }), // Matches your UserQuery model
+        body: JSON.stringify({ query: input, user_id: getUserId() }), // Matches your UserQuery model
       });
 
       const data = await response.json();